@@ -0,0 +1,192 @@
+__author__ = 'tho'
+
+import os
+import cPickle as pickle
+import sqlite3
+import zlib
+
+SQLITE_HEADER = 'SQLite format 3\000'
+
+class Cache:
+    """Cacheable data, kept in an SQLite database with one table per kind of
+    data, so that entries are looked up and added one by one instead of loading
+    and rewriting the whole cache."""
+
+    # name -> True if the values are pickled objects, False for counts
+    TABLES = { 'files_in_tree': False, 'lines_in_blob': False, 'history': True }
+
+    def __init__(self, path = None):
+        self.db = None
+        self.path = None
+        self.tables = {}
+        for name, pickled in self.TABLES.items():
+            self.tables[name] = CacheTable(self, name, pickled)
+        if path is not None:
+            self.open(path)
+
+    def __contains__(self, name):
+        return name in self.tables
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def keys(self):
+        return self.tables.keys()
+
+    def open(self, path):
+        if os.path.exists(path):
+            f = open(path, 'rb')
+            header = f.read(len(SQLITE_HEADER))
+            f.close()
+            # an empty file is a database being created by another process
+            if header != SQLITE_HEADER and header != '':
+                self.migrate(path)
+        # the cache may be shared by reports generated in parallel, wait for
+        # their writes instead of failing
+        self.db = sqlite3.connect(path, timeout = 600)
+        self.db.text_factory = str
+        for name, pickled in self.TABLES.items():
+            self.db.execute('CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value %s)' % (name, pickled and 'BLOB' or 'INTEGER'))
+        self.path = path
+
+    ##
+    # Convert a cache written as a (zlib compressed) pickled dict
+    def migrate(self, path):
+        print('Converting cache to SQLite...')
+        f = open(path, 'rb')
+        try:
+            data = pickle.loads(zlib.decompress(f.read()))
+        except:
+            # non-compressed caches
+            f.seek(0)
+            data = pickle.load(f)
+        f.close()
+
+        tempfile = path + '.tmp'
+        try:
+            os.remove(tempfile)
+        except OSError:
+            pass
+        cache = Cache(tempfile)
+        for name in self.TABLES.keys():
+            cache[name].update(data.get(name, {}))
+        cache.save(tempfile)
+        cache.close()
+        os.rename(tempfile, path)
+
+    ##
+    # Write the entries added since the last save
+    def save(self, path):
+        if self.db is None or self.path != path:
+            self.open(path)
+        for table in self.tables.values():
+            table.flush()
+        self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+        self.db = None
+        self.path = None
+
+class CacheTable:
+    """Dict-like access to one table of the cache. Added entries are kept in
+    memory until the cache is saved."""
+    def __init__(self, cache, name, pickled):
+        self.cache = cache
+        self.name = name
+        self.pickled = pickled
+        self.pending = {}
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if self.pickled:
+            value = sqlite3.Binary(self.dumps(value))
+        self.pending[key] = value
+
+    def get(self, key, default = None):
+        if key in self.pending:
+            value = self.pending[key]
+        elif self.cache.db is not None:
+            row = self.cache.db.execute('SELECT value FROM %s WHERE key = ?' % self.name, (key,)).fetchone()
+            if row is None:
+                return default
+            value = row[0]
+        else:
+            return default
+        if self.pickled:
+            value = self.loads(value, default)
+        return value
+
+    ##
+    # Look up many keys at once, returns a dict of the keys found
+    def getMany(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self.pending:
+                found[key] = self.get(key)
+            else:
+                missing.append(key)
+        if self.cache.db is not None:
+            # stay below the SQLite limit of host parameters
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                rows = self.cache.db.execute('SELECT key, value FROM %s WHERE key IN (%s)' % (self.name, ','.join(['?'] * len(chunk))), chunk)
+                for (key, value) in rows:
+                    if self.pickled:
+                        value = self.loads(value)
+                        if value is None:
+                            continue
+                    found[key] = value
+        return found
+
+    ##
+    # Pickle a value, compressing the pickle as it is written, so that only
+    # its compressed form is held
+    def dumps(self, value):
+        compressor = Compressor()
+        pickle.Pickler(compressor, 2).dump(value)
+        return compressor.getvalue()
+
+    ##
+    # Unpickle a value, or get default for values pickled by older versions
+    # of their classes, which are as good as missing
+    def loads(self, value, default = None):
+        try:
+            return pickle.loads(zlib.decompress(str(value)))
+        except (pickle.UnpicklingError, TypeError, AttributeError, ImportError):
+            return default
+
+    def update(self, entries):
+        for key, value in entries.items():
+            self[key] = value
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+        self.cache.db.executemany('INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.name, self.pending.items())
+        self.pending = {}
+
+class Compressor:
+    """File-like object compressing what is written to it"""
+    def __init__(self):
+        self.compressor = zlib.compressobj()
+        self.chunks = []
+
+    def write(self, data):
+        chunk = self.compressor.compress(data)
+        if len(chunk) > 0:
+            self.chunks.append(chunk)
+
+    def getvalue(self):
+        self.chunks.append(self.compressor.flush())
+        return ''.join(self.chunks)
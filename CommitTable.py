@@ -0,0 +1,110 @@
+__author__ = 'tho'
+
+import datetime
+from array import array
+from itertools import izip
+
+# The local date and hour are the same for every stamp of a quarter of an hour:
+# UTC offsets, and the moments they change, are multiples of 15 minutes
+QUARTER = 900
+
+class CommitTable:
+    """Values of the commits kept as columns of typed arrays, one row per
+    commit, from which the histograms are computed in batches."""
+    def __init__(self):
+        self.stamps = array('l')
+        self.timezones = array('h') # UTC offset in minutes
+        self.identities = array('i') # id in the IdentityTable
+        self.files = array('l')
+        self.inserted = array('l')
+        self.deleted = array('l')
+        self.linestats = array('b') # 1 if the lines count for the lines of code
+
+    def __len__(self):
+        return len(self.stamps)
+
+    def add(self, stamp, timezone, identity, files, inserted, deleted, linestats):
+        self.stamps.append(stamp)
+        self.timezones.append(timezone)
+        self.identities.append(identity)
+        self.files.append(files)
+        self.inserted.append(inserted)
+        self.deleted.append(deleted)
+        self.linestats.append(linestats and 1 or 0)
+
+    ##
+    # Number the quarters of an hour having commits. Returns the number of the
+    # quarter of each row, and the local date and time of each quarter.
+    def getQuarters(self):
+        numbers = {}
+        quarters = array('i')
+        dates = []
+        for stamp in self.stamps:
+            quarter = stamp // QUARTER
+            number = numbers.get(quarter)
+            if number is None:
+                number = numbers[quarter] = len(dates)
+                dates.append(datetime.datetime.fromtimestamp(quarter * QUARTER))
+            quarters.append(number)
+        return (quarters, dates)
+
+    ##
+    # Number of rows by value of column, for values in [0, size)
+    def count(self, column, size):
+        counts = [0] * size
+        for value in column:
+            counts[value] += 1
+        return counts
+
+    ##
+    # Number of rows by pair of values of two columns, as a dict
+    def countPairs(self, column, other):
+        counts = {}
+        for pair in izip(column, other):
+            counts[pair] = counts.get(pair, 0) + 1
+        return counts
+
+    ##
+    # Sums of values of the rows counting for the lines of code, by value of
+    # column, for values in [0, size)
+    def sumLineStats(self, column, size, values):
+        sums = [0] * size
+        for (value, linestats, n) in izip(column, self.linestats, values):
+            if linestats:
+                sums[value] += n
+        return sums
+
+    ##
+    # First and last stamp by value of column, for values in [0, size), None
+    # for the values without rows
+    def getStampRange(self, column, size):
+        first = [None] * size
+        last = [None] * size
+        for (value, stamp) in izip(column, self.stamps):
+            if first[value] is None or stamp < first[value]:
+                first[value] = stamp
+            if last[value] is None or stamp > last[value]:
+                last[value] = stamp
+        return (first, last)
+
+    ##
+    # Number of rows by timezone, as "+HHMM" -> rows
+    def countTimezones(self):
+        counts = {}
+        for offset in self.timezones:
+            counts[offset] = counts.get(offset, 0) + 1
+        timezones = {}
+        for offset, n in counts.items():
+            timezones['%s%02d%02d' % (offset < 0 and '-' or '+', abs(offset) / 60, abs(offset) % 60)] = n
+        return timezones
+
+##
+# Convert a "+HHMM" timezone to minutes
+def gettimezoneoffset(timezone):
+    try:
+        minutes = int(timezone[1:3]) * 60 + int(timezone[3:5])
+    except ValueError:
+        return 0
+    if timezone.startswith('-'):
+        return -minutes
+    return minutes
@@ -1,18 +1,19 @@
+from Cache import Cache
+from Series import Series
+from TopCounter import TopCounter
 from config import conf
 
 __author__ = 'tho'
 
 import datetime
 import os
-import pickle
 import time
-import zlib
 
 class DataCollector:
     """Manages data collection from a revision control repository."""
     def __init__(self):
         self.stamp_created = time.time()
-        self.cache = {}
+        self.cache = Cache()
         self.total_authors = 0
         self.activity_by_hour_of_day = {}       # hour -> commits
         self.activity_by_day_of_week = {}       # day -> commits
@@ -23,7 +24,7 @@ class DataCollector:
         self.activity_by_year_week = {}         # yy_wNN -> commits
         self.activity_by_year_week_peak = 0
 
-        self.authors = {}           # name -> {commits, first_commit_stamp, last_commit_stamp, last_active_day, active_days, lines_added, lines_removed}
+        self.authors = {}           # name -> {commits, first_commit_stamp, last_commit_stamp, active_days (count), lines_added, lines_removed}
 
         self.total_commits = 0
         self.total_files = 0
@@ -43,7 +44,6 @@ class DataCollector:
         self.lines_removed_by_year = {} # year -> lines removed
         self.first_commit_stamp = 0
         self.last_commit_stamp = 0
-        self.last_active_day = None
         self.active_days = set()
 
         # lines
@@ -63,13 +63,23 @@ class DataCollector:
         # branches
         self.branches = []
 
-        self.files_by_stamp = {} # stamp -> files
+        self.files_by_stamp = Series(1) # (stamp, files)
 
         # extensions
         self.extensions = {} # extension -> files, lines
 
+        # files
+        self.largest_files = [] # (lines, size, path), largest first
+        self.file_revisions = TopCounter() # path -> commits changing it
+        self.file_churn = TopCounter() # path -> lines inserted and deleted
+
         # line statistics
-        self.changes_by_date = {} # stamp -> { files, ins, del }
+        self.lines_by_stamp = Series(1) # (stamp, lines of code)
+
+        # per-author statistics, at each stamp the author commited at, oldest first
+        self.author_stamps = [] # author id -> array of stamps
+        self.author_cumulated_lines = [] # author id -> array of lines added until stamp
+        self.author_cumulated_commits = [] # author id -> array of commits until stamp
 
     ##
     # This should be the main function to extract data from the repository.
@@ -86,14 +96,8 @@ class DataCollector:
         if not os.path.exists(cachefile):
             return
         print('Loading cache...')
-        f = open(cachefile, 'rb')
-        try:
-            self.cache = pickle.loads(zlib.decompress(f.read()))
-        except:
-            # temporary hack to upgrade non-compressed caches
-            f.seek(0)
-            self.cache = pickle.load(f)
-        f.close()
+        self.cache.close()
+        self.cache = Cache(cachefile)
 
     ##
     # Produce any additional statistics from the extracted data.
@@ -115,6 +119,12 @@ class DataCollector:
     def getDomainInfo(self, domain):
         return None
 
+    ##
+    # Get the cumulated lines added and commits of authors, as series of
+    # (stamp, value of each author), one row per stamp any author commited at
+    def getCumulatedByAuthor(self, authors):
+        return (Series(len(authors)), Series(len(authors)))
+
     ##
     # Get a list of authors
     def getAuthors(self):
@@ -148,14 +158,4 @@ class DataCollector:
     # Save cacheable data
     def saveCache(self, cachefile):
         print('Saving cache...')
-        tempfile = cachefile + '.tmp'
-        f = open(tempfile, 'wb')
-        #pickle.dump(self.cache, f)
-        data = zlib.compress(pickle.dumps(self.cache))
-        f.write(data)
-        f.close()
-        try:
-            os.remove(cachefile)
-        except OSError:
-            pass
-        os.rename(tempfile, cachefile)
+        self.cache.save(cachefile)
@@ -0,0 +1,122 @@
+__author__ = 'tho'
+
+from collections import deque
+from itertools import izip
+
+from config import conf
+
+class Downsampler:
+    """Reduces the rows of a graph, (x, value, ...) sorted by x, to at most
+    max_points rows, keeping the shape and the peaks of every value column.
+    Rows are kept whole, so the columns stay aligned on the same x. The rows
+    are read as a stream, once per column, so that they may be a list or a
+    series read back from disk."""
+    def __init__(self, max_points = None, method = None):
+        if max_points is None:
+            max_points = conf['max_points']
+        if method is None:
+            method = conf['downsampling']
+        self.max_points = max_points
+        self.method = method
+
+    def downsample(self, rows):
+        n = len(rows)
+        first = next(iter(rows), None)
+        columns = first is not None and len(first) - 1 or 0
+        if self.max_points <= 0 or n <= self.max_points or columns == 0:
+            return list(rows)
+        # each column gets its share of the points, the rows picked by any are
+        # kept. The first and last rows are kept besides, which takes a share
+        # of 3 points for lttb and of 4 for buckets to fit in max_points.
+        share = self.max_points / columns
+        if self.method == 'buckets' and share >= 4:
+            for last in rows:
+                pass
+            picked = self.getBucketRows(rows, n, share, (float(first[0]), float(last[0])))
+        elif self.method == 'lttb' and share >= 3:
+            picked = self.getLttbRows(rows, n, share)
+        else:
+            picked = self.getEvenRows(rows, n)
+        return [picked[i] for i in sorted(picked.keys())]
+
+    ##
+    # Keep max_points rows evenly spaced by index, the first and last ones
+    # included, for too many columns to give each its share.
+    # Returns the rows kept by index.
+    def getEvenRows(self, rows, n):
+        kept = set([i * (n - 1) / max(self.max_points - 1, 1) for i in range(0, self.max_points)])
+        return dict([(i, row) for (i, row) in enumerate(rows) if i in kept])
+
+    ##
+    # Largest-Triangle-Three-Buckets: keep the first and last rows and, of each
+    # of threshold - 2 buckets in between (threshold being 3 or more), the row making the largest triangle
+    # with the row kept before it and the average of the next bucket, for each
+    # column. The buckets are the same for every column, so the rows are read
+    # once, only those of a bucket and the next one being held.
+    # Returns the rows kept by index.
+    def getLttbRows(self, rows, n, threshold):
+        threshold = max(threshold, 3)
+        rows = iter(rows)
+        row = next(rows)
+        picked = { 0: row }
+        if threshold >= n:
+            picked.update(enumerate(rows, 1))
+            return picked
+        columns = range(1, len(row))
+        previous = [(float(row[0]), float(row[column])) for column in [0] + columns] # of each column
+        every = float(n - 2) / (threshold - 2)
+        pending = deque() # (index, row, values as floats) of the rows after the bucket
+        read = 1
+        for i in range(0, threshold - 2):
+            end = int((i + 1) * every) + 1
+            next_end = min(int((i + 2) * every) + 1, n)
+            while read < next_end:
+                row = next(rows)
+                pending.append((read, row, map(float, row)))
+                read += 1
+            bucket = []
+            while pending[0][0] < end:
+                bucket.append(pending.popleft())
+            # what is left is the next bucket, values by column
+            following = zip(*[values for (j, r, values) in pending])
+            values = zip(*[values for (j, r, values) in bucket])
+            xs = values[0]
+            average_x = sum(following[0]) / (next_end - end)
+            for column in columns:
+                average_y = sum(following[column]) / (next_end - end)
+                (x, y) = previous[column]
+                (dx, dy) = (x - average_x, average_y - y)
+                areas = [abs(dx * (value - y) - (x - xj) * dy) for (xj, value) in izip(xs, values[column])]
+                k = areas.index(max(areas))
+                picked[bucket[k][0]] = bucket[k][1]
+                previous[column] = (xs[k], values[column][k])
+        for row in rows:
+            pass
+        picked[n - 1] = row
+        return picked
+
+    ##
+    # Fixed time buckets: split the x range in equal buckets and keep, of each
+    # bucket, the rows with the lowest and the highest value of each column.
+    # span is the (first, last) x of the rows. Returns the rows kept by index.
+    def getBucketRows(self, rows, n, threshold, span):
+        buckets = max((threshold - 2) / 2, 1)
+        first = span[0]
+        span = max(span[1] - first, 1.0)
+        lowest = {} # (column, bucket) -> (value, index, row)
+        highest = {}
+        picked = {}
+        for (i, row) in enumerate(rows):
+            if i == 0 or i == n - 1:
+                picked[i] = row
+            bucket = min(int((float(row[0]) - first) / span * buckets), buckets - 1)
+            for column in range(1, len(row)):
+                y = float(row[column])
+                key = (column, bucket)
+                if key not in lowest or y < lowest[key][0]:
+                    lowest[key] = (y, i, row)
+                if key not in highest or y > highest[key][0]:
+                    highest[key] = (y, i, row)
+        for (y, i, row) in lowest.values() + highest.values():
+            picked[i] = row
+        return picked
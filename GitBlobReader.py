@@ -0,0 +1,87 @@
+__author__ = 'tho'
+
+import subprocess
+import threading
+import time
+
+import common
+from config import conf
+
+class GitBlobReader:
+    """Reads blobs through a few long-lived "git cat-file --batch" processes."""
+    ARGS = ['git', 'cat-file', '--batch']
+
+    def __init__(self, processes = None):
+        if processes is None:
+            processes = conf['processes']
+        self.processes = []
+        for i in range(0, max(1, processes)):
+            self.processes.append(subprocess.Popen(self.ARGS, stdin = subprocess.PIPE, stdout = subprocess.PIPE, bufsize = -1))
+        self.start = time.time()
+        self.nbytes = 0
+
+    ##
+    # Get the number of lines of each of the given blobs, as a dict blob -> lines.
+    # Blobs are spread over the processes, and the lines are counted in-process.
+    def getLineCounts(self, blob_ids):
+        blob_ids = list(set(blob_ids))
+        start = time.time()
+        counts = {}
+        sizes = []
+        busy = []
+        threads = []
+        n = len(self.processes)
+        for i, p in enumerate(self.processes):
+            ids = blob_ids[i::n]
+            if len(ids) == 0:
+                continue
+            t = threading.Thread(target = self.countLines, args = (p, ids, counts, sizes, busy))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        self.nbytes += sum(sizes)
+        common.addpoolusage('blobs', start, len(threads), sum(busy))
+        return counts
+
+    def countLines(self, p, blob_ids, counts, sizes, busy):
+        start = time.time()
+        # the ids are written from another thread, so that neither pipe fills up
+        writer = threading.Thread(target = self.writeIds, args = (p, blob_ids))
+        writer.start()
+        nbytes = 0
+        for i in range(0, len(blob_ids)):
+            # <sha> blob <size>, or <object> missing
+            header = p.stdout.readline().split()
+            if len(header) == 0:
+                print('Warning: git cat-file exited early')
+                break
+            if len(header) != 3:
+                print('Warning: failed to read blob "%s"' % header[0])
+                counts[header[0]] = 0
+                continue
+            size = int(header[2])
+            nbytes += size
+            lines = 0
+            while size > 0:
+                chunk = p.stdout.read(min(size, 1048576))
+                lines += chunk.count('\n')
+                size -= len(chunk)
+            p.stdout.read(1) # newline after the contents
+            counts[header[0]] = lines
+        writer.join()
+        sizes.append(nbytes)
+        busy.append(time.time() - start)
+
+    def writeIds(self, p, blob_ids):
+        p.stdin.write(''.join([blob_id + '\n' for blob_id in blob_ids]))
+        p.stdin.flush()
+
+    def close(self):
+        status = 0
+        for p in self.processes:
+            p.stdin.close()
+            status = max(status, p.wait())
+        if len(self.processes) > 0:
+            common.addexternalcommand(self.ARGS, self.start, time.time() - self.start, self.nbytes, status)
+        self.processes = []
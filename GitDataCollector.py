@@ -1,233 +1,207 @@
+from CommitTable import CommitTable, gettimezoneoffset
 from DataCollector import DataCollector
+from GitBlobReader import GitBlobReader
+from IdentityTable import IdentityTable
+from Series import Series
 from common import *
 
 __author__ = 'tho'
 
 import datetime
+import heapq
+import os
 import re
 
-from multiprocessing import Pool
-
-class GitDataCollector(DataCollector):
-    def collect(self, dir):
-        DataCollector.collect(self, dir)
-
-        main_branch = 'master'
-        lines = getpipeoutput(['git branch -a']).split('\n')
-        for line in lines:
-            if len(line) < 2:
-                continue
-            line = line[2:]
-            branch_name = line.split(' ')[0].replace('remotes/origin/', '')
-            if branch_name == 'HEAD':
-                main_branch = line.split(' ')[2]
-                continue
-
-            self.branches.append(branch_name)
-
-        self.total_authors += int(getpipeoutput(['git shortlog -s %s %s' % (getcommitrange(), get_commit_time()), 'wc -l']))
-        #self.total_lines = int(getoutput('git-ls-files -z |xargs -0 cat |wc -l'))
-
-        # tags
-        lines = getpipeoutput(['git show-ref --tags']).split('\n')
-        for line in lines:
-            if len(line) == 0:
-                continue
-            (hash, tag) = line.split(' ')
-
-            tag = tag.replace('refs/tags/', '')
-            output = getpipeoutput(['git log "%s" --pretty=format:"%%at %%aN" -n 1' % hash])
-            if len(output) > 0:
-                parts = output.split(' ')
-                stamp = 0
-                try:
-                    stamp = int(parts[0])
-                except ValueError:
-                    stamp = 0
-                self.tags[tag] = { 'stamp': stamp, 'hash' : hash, 'date' : datetime.datetime.fromtimestamp(stamp).strftime('%Y-%m-%d'), 'commits': 0, 'authors': {} }
-
-        # collect info on tags, starting from latest
-        tags_sorted_by_date_desc = map(lambda el : el[1], reversed(sorted(map(lambda el : (el[1]['date'], el[0]), self.tags.items()))))
-        prev = None
-        for tag in reversed(tags_sorted_by_date_desc):
-            cmd = 'git shortlog -s "%s"' % tag
-            if prev != None:
-                cmd += ' "^%s"' % prev
-            output = getpipeoutput([cmd])
-            if len(output) == 0:
-                continue
-            prev = tag
-            for line in output.split('\n'):
-                parts = re.split('\s+', line, 2)
-                commits = int(parts[1])
-                author = parts[2]
-                if author in conf['merge_authors']:
-                    author = conf['merge_authors'][author]
-                self.tags[tag]['commits'] += commits
-                self.tags[tag]['authors'][author] = commits
-
-        # Collect revision statistics
-        # Outputs "<stamp> <date> <time> <timezone> <author> '<' <mail> '>'"
-        rev_list_output = getpipeoutput(['git rev-list --pretty=format:"%%at %%ai %%aN <%%aE>" %s %s' % (getcommitrange('HEAD'), get_commit_time()), 'grep -v ^commit'])
-        if rev_list_output:
-            lines = rev_list_output.split('\n')
-        else:
-            lines = []
-        for line in lines:
-            parts = line.split(' ', 4)
-            author = ''
+from array import array
+from collections import namedtuple
+from itertools import groupby, izip, repeat
+from operator import itemgetter
+
+# Outputs "\x02<hash>\x01<parents>\x01<tree>\x01<stamp> <date> <time> <timezone>\x01<author>\x01<mail>",
+# followed by the NUL separated --raw and --numstat entries of the commit.
+# Renamed and copied paths are given as a source and a destination path, and
+# have an empty path in the --numstat entry.
+LOG_FORMAT = '%x02%H%x01%P%x01%T%x01%at %ai%x01%aN%x01%aE'
+
+# merges are diffed against their first parent, which is what the
+# linear line statistics need; author statistics skip them
+LOG_ARGS = ['git', 'log', '-z', '--raw', '--numstat', '--diff-merges=first-parent', '--pretty=format:' + LOG_FORMAT]
+
+# changes holds the "<inserted>\t<deleted>\t<path>" entries of the commit, joined by NULs
+Commit = namedtuple('Commit', 'sha parents tree stamp timezone author mail files inserted deleted files_delta changes')
+# Bytes of memory a parsed commit takes, about, besides its changes
+COMMIT_SIZE = 1024
+
+def getlogrecords(args, input = None):
+    """
+    Parse the output of "git log -z --raw --numstat --pretty=format:LOG_FORMAT"
+    into one Commit per commit, as the output is produced
+    """
+    header = None
+    paths = 0
+    renamed = None # counts of the --numstat entry of a renamed or copied path
+    for token in getpipestream(args, '\0', input = input):
+        if paths > 0:
+            paths -= 1
+            if paths == 0 and renamed is not None:
+                # the destination path
+                changes.append(renamed + token)
+                renamed = None
+            continue
+        if token.startswith('\x02'):
+            if header is not None:
+                yield Commit(*(header + counts + ['\0'.join(changes)]))
+            line, sep, token = token[1:].partition('\n')
+            (sha, parents, tree, date, author, mail) = line.split('\x01')
+            parts = date.split(' ')
             try:
                 stamp = int(parts[0])
             except ValueError:
                 stamp = 0
-            timezone = parts[3]
-            author, mail = parts[4].split('<', 1)
-            author = author.rstrip()
-            if author in conf['merge_authors']:
-                author = conf['merge_authors'][author]
-            mail = mail.rstrip('>')
-            domain = '?'
-            if mail.find('@') != -1:
-                domain = mail.rsplit('@', 1)[1]
-            date = datetime.datetime.fromtimestamp(float(stamp))
-
-            # First and last commit stamp (may be in any order because of cherry-picking and patches)
-            if stamp > self.last_commit_stamp:
-                self.last_commit_stamp = stamp
-            if self.first_commit_stamp == 0 or stamp < self.first_commit_stamp:
-                self.first_commit_stamp = stamp
-
-            # activity
-            # hour
-            hour = date.hour
-            self.activity_by_hour_of_day[hour] = self.activity_by_hour_of_day.get(hour, 0) + 1
-            # most active hour?
-            if self.activity_by_hour_of_day[hour] > self.activity_by_hour_of_day_busiest:
-                self.activity_by_hour_of_day_busiest = self.activity_by_hour_of_day[hour]
-
-            # day of week
-            day = date.weekday()
-            self.activity_by_day_of_week[day] = self.activity_by_day_of_week.get(day, 0) + 1
-
-            # domain stats
-            if domain not in self.domains:
-                self.domains[domain] = {}
-            # commits
-            self.domains[domain]['commits'] = self.domains[domain].get('commits', 0) + 1
+            header = [sha, tuple(parents.split()), tree, stamp, parts[3], author, mail]
+            counts = [0, 0, 0, 0] # files, inserted, deleted, files delta
+            changes = []
+        if len(token) == 0 or header is None:
+            continue
+        if token.startswith(':'):
+            # :<old mode> <new mode> <old blob> <new blob> <status>
+            status = token.split(' ')[-1][0]
+            if status == 'A' or status == 'C':
+                counts[3] += 1
+            elif status == 'D':
+                counts[3] -= 1
+            paths = 1
+            if status == 'R' or status == 'C':
+                paths = 2
+            continue
+        # <inserted> <deleted> <path>, "-" for binary files
+        parts = token.split('\t', 2)
+        if len(parts) != 3:
+            print('Warning: unexpected entry "%s"' % token)
+            continue
+        if len(parts[2]) == 0:
+            paths = 2
+            renamed = token
+        else:
+            changes.append(token)
+        counts[0] += 1
+        if parts[0] != '-':
+            counts[1] += int(parts[0])
+            counts[2] += int(parts[1])
+    if header is not None:
+        yield Commit(*(header + counts + ['\0'.join(changes)]))
+
+class GitHistory:
+    """Commits of a repository, shared by the collectors of its branches so
+    that each commit is read and diffed only once. With a memory budget, only
+    as many commits as half of it holds, changed paths included, are kept, the
+    others being read again by the next branch."""
+    def __init__(self):
+        self.commits = {} # hash -> Commit
+        self.size = 0 # bytes the kept commits take, about
+        self.limit = None # bytes kept at most
+        if conf['memory_budget'] > 0:
+            self.limit = conf['memory_budget'] * 1048576 / 2
+        # the tags and the files of a revision are the same for every window
+        self.tags = None # tag -> { stamp, hash, date, commits, authors }, once collected
+        self.files = {} # revision -> (files, size, extension -> { files, lines }, largest files)
+
+    ##
+    # Get the commits of the given revisions, newest first in --date-order
+    def getCommits(self, revs):
+        if len(self.commits) == 0 or self.isFull():
+            for commit in getlogrecords(LOG_ARGS + ['--date-order'] + revs):
+                self.keep(commit)
+                yield commit
+            return
+
+        # only list the commits, and read the ones no other branch had
+        order = list(getpipestream(['git', 'rev-list', '--date-order'] + revs))
+        missing = [sha for sha in order if sha not in self.commits]
+        if self.limit is not None and self.size + len(missing) * COMMIT_SIZE > self.limit:
+            # they would not all be kept, read the whole walk again
+            del order, missing
+            for commit in getlogrecords(LOG_ARGS + ['--date-order'] + revs):
+                self.keep(commit)
+                yield commit
+            return
+        # the missing commits are read in the order of the walk, as they come
+        read = getlogrecords(LOG_ARGS + ['--no-walk=unsorted', '--stdin'], missing)
+        for sha in order:
+            commit = self.commits.get(sha)
+            if commit is None:
+                commit = next(read)
+                self.keep(commit)
+            yield commit
+
+    def keep(self, commit):
+        size = COMMIT_SIZE + len(commit.changes)
+        if self.limit is None or self.size + size <= self.limit:
+            self.commits[commit.sha] = commit
+            self.size += size
+
+    def isFull(self):
+        return self.limit is not None and self.size + COMMIT_SIZE > self.limit
+
+# Statistics filled by the history walk. They are kept in the cache together
+# with the newest commit walked, so that the next run only walks newer commits.
+# The histograms are computed from the commit table after the walk.
+HISTORY_STATE = ('identities', 'total_commits', 'commit_table',
+    'author_commits', 'author_lines_added', 'author_lines_removed',
+    'total_lines', 'total_lines_added', 'total_lines_removed',
+    'files_by_stamp', 'lines_by_stamp',
+    'author_stamps', 'author_cumulated_lines', 'author_cumulated_commits',
+    'file_revisions', 'file_churn')
+# Changed whenever HISTORY_STATE changes, so that older states are not resumed
+HISTORY_VERSION = 6
 
-            # hour of week
-            if day not in self.activity_by_hour_of_week:
-                self.activity_by_hour_of_week[day] = {}
-            self.activity_by_hour_of_week[day][hour] = self.activity_by_hour_of_week[day].get(hour, 0) + 1
-            # most active hour?
-            if self.activity_by_hour_of_week[day][hour] > self.activity_by_hour_of_week_busiest:
-                self.activity_by_hour_of_week_busiest = self.activity_by_hour_of_week[day][hour]
-
-            # month of year
-            month = date.month
-            self.activity_by_month_of_year[month] = self.activity_by_month_of_year.get(month, 0) + 1
-
-            # yearly/weekly activity
-            yyw = date.strftime('%Y-%W')
-            self.activity_by_year_week[yyw] = self.activity_by_year_week.get(yyw, 0) + 1
-            if self.activity_by_year_week_peak < self.activity_by_year_week[yyw]:
-                self.activity_by_year_week_peak = self.activity_by_year_week[yyw]
-
-            # author stats
-            if author not in self.authors:
-                self.authors[author] = {}
-            # commits, note again that commits may be in any date order because of cherry-picking and patches
-            if 'last_commit_stamp' not in self.authors[author]:
-                self.authors[author]['last_commit_stamp'] = stamp
-            if stamp > self.authors[author]['last_commit_stamp']:
-                self.authors[author]['last_commit_stamp'] = stamp
-            if 'first_commit_stamp' not in self.authors[author]:
-                self.authors[author]['first_commit_stamp'] = stamp
-            if stamp < self.authors[author]['first_commit_stamp']:
-                self.authors[author]['first_commit_stamp'] = stamp
-
-            # author of the month/year
-            yymm = date.strftime('%Y-%m')
-            if yymm in self.author_of_month:
-                self.author_of_month[yymm][author] = self.author_of_month[yymm].get(author, 0) + 1
-            else:
-                self.author_of_month[yymm] = {}
-                self.author_of_month[yymm][author] = 1
-            self.commits_by_month[yymm] = self.commits_by_month.get(yymm, 0) + 1
+class GitDataCollector(DataCollector):
+    def __init__(self):
+        DataCollector.__init__(self)
+        self.identities = IdentityTable()
+        self.commit_table = CommitTable()
+        # by author id, of the commits walked so far
+        self.author_commits = array('l')
+        self.author_lines_added = array('l')
+        self.author_lines_removed = array('l')
+
+    ##
+    # Collect the statistics of ref (default: commit_end), reading the commits
+    # through history, which can be shared by the collectors of several branches
+    def collect(self, dir, ref = None, history = None):
+        DataCollector.collect(self, dir)
+        self.ref = ref
+        self.history = history
+        if self.history is None:
+            self.history = GitHistory()
 
-            yy = date.year
-            if yy in self.author_of_year:
-                self.author_of_year[yy][author] = self.author_of_year[yy].get(author, 0) + 1
-            else:
-                self.author_of_year[yy] = {}
-                self.author_of_year[yy][author] = 1
-            self.commits_by_year[yy] = self.commits_by_year.get(yy, 0) + 1
-
-            # authors: active days
-            yymmdd = date.strftime('%Y-%m-%d')
-            if 'last_active_day' not in self.authors[author]:
-                self.authors[author]['last_active_day'] = yymmdd
-                self.authors[author]['active_days'] = set([yymmdd])
-            elif yymmdd != self.authors[author]['last_active_day']:
-                self.authors[author]['last_active_day'] = yymmdd
-                self.authors[author]['active_days'].add(yymmdd)
-
-            # project: active days
-            if yymmdd != self.last_active_day:
-                self.last_active_day = yymmdd
-                self.active_days.add(yymmdd)
-
-            # timezone
-            self.commits_by_timezone[timezone] = self.commits_by_timezone.get(timezone, 0) + 1
-
-        # outputs "<stamp> <files>" for each revision
-        revlines = getpipeoutput(['git rev-list --pretty=format:"%%at %%T" %s %s' % (getcommitrange('HEAD'), get_commit_time()), 'grep -v ^commit']).strip().split('\n')
-        lines = []
-        revs_to_read = []
-        time_rev_count = []
-        #Look up rev in cache and take info from cache if found
-        #If not append rev to list of rev to read from repo
-        for revline in revlines:
-            if not (' ' in revline):
-                continue
-            time, rev = revline.split(' ')
-            #if cache empty then add time and rev to list of new rev's
-            #otherwise try to read needed info from cache
-            if 'files_in_tree' not in self.cache.keys():
-                revs_to_read.append((time,rev))
-                continue
-            if rev in self.cache['files_in_tree'].keys():
-                lines.append('%d %d' % (int(time), self.cache['files_in_tree'][rev]))
-            else:
-                revs_to_read.append((time,rev))
-
-        #Read revisions from repo
-        pool = Pool(processes=conf['processes']);
-        time_rev_count = pool.map(getnumoffilesfromrev, revs_to_read)
-        pool.close()
-
-        #Update cache with new revisions and append then to general list
-        for (time, rev, count) in time_rev_count:
-            if 'files_in_tree' not in self.cache:
-                self.cache['files_in_tree'] = {}
-            self.cache['files_in_tree'][rev] = count
-            lines.append('%d %d' % (int(time), count))
-
-        self.total_commits += len(lines)
-        for line in lines:
-            parts = line.split(' ')
-            if len(parts) != 2:
-                continue
-            (stamp, files) = parts[0:2]
-            try:
-                self.files_by_stamp[int(stamp)] = int(files)
-            except ValueError:
-                print('Warning: failed to parse line "%s"' % line)
+        self.branches = [branch_name for (branch_name, rev) in getbranches()]
 
-        # extensions and size of files
-        lines = getpipeoutput(['git ls-tree -r -l -z %s' % (getcommitrange('HEAD', end_only = True)) ]).split('\000')
-        blobs_to_read = []
-        for line in lines:
+        #self.total_lines = int(getoutput('git-ls-files -z |xargs -0 cat |wc -l'))
+
+        # Collect revision statistics, line statistics, per-author statistics
+        # and file counts in a single pass over the history
+        with phase('history'):
+            self.collectHistoryIncremental()
+        with phase('histograms'):
+            self.addHistograms()
+
+        # tags, after the history, whose identities they share
+        with phase('tags'):
+            self.collectTags()
+
+        with phase('files'):
+            self.collectFiles()
+
+    ##
+    # Collect the extensions and size of the files of ref, and their lines
+    def collectFiles(self):
+        rev = getcommitrange('HEAD', end_only = True, end = self.ref)
+        if rev in self.history.files:
+            (self.total_files, self.total_size, self.extensions, self.largest_files) = self.history.files[rev]
+            return
+        blobs = []
+        for line in getpipestream(['git', 'ls-tree', '-r', '-l', '-z', rev], '\0'):
             if len(line) == 0:
                 continue
             parts = re.split('\s+', line, 5)
@@ -251,139 +225,361 @@ class GitDataCollector(DataCollector):
             if ext not in self.extensions:
                 self.extensions[ext] = {'files': 0, 'lines': 0}
             self.extensions[ext]['files'] += 1
-            #if cache empty then add ext and blob id to list of new blob's
-            #otherwise try to read needed info from cache
-            if 'lines_in_blob' not in self.cache.keys():
-                blobs_to_read.append((ext,blob_id))
+            blobs.append((ext, blob_id, size, fullpath))
+
+        #Look up blob's in cache, and get info about line count for new blob's that wasn't found in cache
+        linecounts = self.cache['lines_in_blob'].getMany([blob_id for (ext, blob_id, size, fullpath) in blobs])
+        blobs_to_read = [blob_id for (ext, blob_id, size, fullpath) in blobs if blob_id not in linecounts]
+        if len(blobs_to_read) > 0:
+            reader = GitBlobReader(min(conf['processes'], len(blobs_to_read)))
+            newcounts = reader.getLineCounts(blobs_to_read)
+            reader.close()
+            #Update cache with the new blob's
+            self.cache['lines_in_blob'].update(newcounts)
+            linecounts.update(newcounts)
+
+        #Write down info about number of number of lines
+        for (ext, blob_id, size, fullpath) in blobs:
+            self.extensions[ext]['lines'] += linecounts[blob_id]
+        # only the largest are held while the files are gone through, ties in path order
+        self.largest_files = heapq.nlargest(conf['max_files'], ((linecounts[blob_id], size, fullpath) for (ext, blob_id, size, fullpath) in blobs), key = itemgetter(0, 1))
+        self.history.files[rev] = (self.total_files, self.total_size, self.extensions, self.largest_files)
+
+    ##
+    # Collect the date of every tag, and the commits and authors of each tag,
+    # that is the commits it contains which no tag preceding it by date contains
+    def collectTags(self):
+        if self.history.tags is not None:
+            self.tags = self.history.tags
+            return
+        self.history.tags = self.tags
+
+        # Outputs "<hash> <commit of an annotated tag> <stamp> <stamp of an annotated tag> <tag>"
+        tagged = {} # commit -> tags
+        for line in getpipestream(['git', 'for-each-ref', '--format=%(objectname) %(*objectname) %(authordate:unix) %(*authordate:unix) %(refname)', 'refs/tags']):
+            if len(line) == 0:
                 continue
-            if blob_id in self.cache['lines_in_blob'].keys():
-                self.extensions[ext]['lines'] += self.cache['lines_in_blob'][blob_id]
+            (hash, commit, stamp, tagstamp, tag) = line.split(' ', 4)
+            if len(commit) == 0:
+                commit = hash
             else:
-                blobs_to_read.append((ext,blob_id))
-
-        #Get info abount line count for new blob's that wasn't found in cache
-        pool = Pool(processes=24);
-        ext_blob_linecount = pool.map(getnumoflinesinblob, blobs_to_read)
-        pool.close()
-
-        #Update cache and write down info about number of number of lines
-        for (ext, blob_id, linecount) in ext_blob_linecount:
-            if 'lines_in_blob' not in self.cache:
-                self.cache['lines_in_blob'] = {}
-            self.cache['lines_in_blob'][blob_id] = linecount
-            self.extensions[ext]['lines'] += self.cache['lines_in_blob'][blob_id]
-
-        # line statistics
-        # outputs:
-        #  N files changed, N insertions (+), N deletions(-)
-        # <stamp> <author>
-        self.changes_by_date = {} # stamp -> { files, ins, del }
-        # computation of lines of code by date is better done
-        # on a linear history.
-        extra = ''
-        if conf['linear_linestats']:
-            extra = '--first-parent -m'
-        lines = getpipeoutput(['git log --shortstat %s --pretty=format:"%%at %%aN" %s %s' % (extra, getcommitrange('HEAD'), get_commit_time())]).split('\n')
-        lines.reverse()
-        files = 0; inserted = 0; deleted = 0; total_lines = 0
-        author = None
-        for line in lines:
-            if len(line) == 0:
+                stamp = tagstamp
+            if len(stamp) == 0:
+                # not a commit
                 continue
 
-            # <stamp> <author>
-            if re.search('files? changed', line) is None:
-                pos = line.find(' ')
-                if pos != -1:
-                    try:
-                        (stamp, author) = (int(line[:pos]), line[pos+1:])
-                        if author in conf['merge_authors']:
-                            author = conf['merge_authors'][author]
-                        self.changes_by_date[stamp] = { 'files': files, 'ins': inserted, 'del': deleted, 'lines': total_lines }
-
-                        date = datetime.datetime.fromtimestamp(stamp)
-                        yymm = date.strftime('%Y-%m')
-                        self.lines_added_by_month[yymm] = self.lines_added_by_month.get(yymm, 0) + inserted
-                        self.lines_removed_by_month[yymm] = self.lines_removed_by_month.get(yymm, 0) + deleted
-
-                        yy = date.year
-                        self.lines_added_by_year[yy] = self.lines_added_by_year.get(yy,0) + inserted
-                        self.lines_removed_by_year[yy] = self.lines_removed_by_year.get(yy, 0) + deleted
-
-                        files, inserted, deleted = 0, 0, 0
-                    except ValueError:
-                        print('Warning: unexpected line "%s"' % line)
-                else:
-                    print('Warning: unexpected line "%s"' % line)
+            tag = tag.replace('refs/tags/', '')
+            stamp = int(stamp)
+            self.tags[tag] = { 'stamp': stamp, 'hash' : hash, 'date' : datetime.datetime.fromtimestamp(stamp).strftime('%Y-%m-%d'), 'commits': 0, 'authors': {} }
+            tagged.setdefault(commit, []).append(tag)
+
+        if len(self.tags) == 0:
+            return
+
+        # walk the history of all tags once, children before parents, passing
+        # the earliest tag containing each commit down to its parents
+        tags_sorted_by_date = map(lambda el : el[1], sorted(map(lambda el : (el[1]['date'], el[0]), self.tags.items())))
+        place = {} # tag -> place by date
+        for i, tag in enumerate(tags_sorted_by_date):
+            place[tag] = i
+        pending = {} # commit -> place of the earliest tag containing it
+        for commit, tags in tagged.items():
+            pending[commit] = min([place[tag] for tag in tags])
+
+        counts = {} # (place, author id) -> commits
+        for line in getpipestream(['git', 'log', '--date-order', '--pretty=format:%H %P%x01%aN%x01%aE', '--tags']):
+            revs, name, mail = line.split('\x01', 2)
+            revs = revs.split()
+            i = pending.pop(revs[0], None)
+            if i is None:
+                print('Warning: unexpected commit "%s"' % revs[0])
+                continue
+            for parent in revs[1:]:
+                pending[parent] = min(pending.get(parent, i), i)
+
+            key = (i, self.identities.authors[self.identities.getId(name, mail)])
+            counts[key] = counts.get(key, 0) + 1
+
+        for ((i, author), n) in counts.items():
+            tag = tags_sorted_by_date[i]
+            self.tags[tag]['commits'] += n
+            self.tags[tag]['authors'][self.identities.author_names[author]] = n
+
+    ##
+    # Walk the history, resuming from the statistics and the newest commit
+    # (watermark) of the previous run when the watermark is still part of the
+    # history, and save them for the next run
+    def collectHistoryIncremental(self):
+        end = getcommitrange('HEAD', end_only = True, end = self.ref)
+        ref = getpipeoutput(['git', 'rev-parse', '--symbolic-full-name', end])
+        if len(ref) == 0:
+            ref = end
+        # one state per window, replaced as a relative window moves on: its
+        # time arguments are options, so a window which moved is walked again
+        key = '%s:%s:%s:%s' % (os.path.abspath(self.dir), ref, conf['commit_begin'], conf['output_suffix'])
+        options = (HISTORY_VERSION, get_commit_time_args(), conf['linear_linestats'], sorted(conf['merge_authors'].items()))
+
+        state = self.cache['history'].get(key)
+        watermark = None
+        if state is not None and state['options'] == options:
+            if getpipeoutput(['git', 'merge-base', state['watermark'], end]) == state['watermark']:
+                watermark = state['watermark']
             else:
-                numbers = getstatsummarycounts(line)
-
-                if len(numbers) == 3:
-                    (files, inserted, deleted) = map(lambda el : int(el), numbers)
-                    total_lines += inserted
-                    total_lines -= deleted
-                    self.total_lines_added += inserted
-                    self.total_lines_removed += deleted
-
-                else:
-                    print('Warning: failed to handle line "%s"' % line)
-                    (files, inserted, deleted) = (0, 0, 0)
-                #self.changes_by_date[stamp] = { 'files': files, 'ins': inserted, 'del': deleted }
-        self.total_lines += total_lines
-
-        # Per-author statistics
-
-        # defined for stamp, author only if author commited at this timestamp.
-        self.changes_by_date_by_author = {} # stamp -> author -> lines_added
-
-        # Similar to the above, but never use --first-parent
-        # (we need to walk through every commit to know who
-        # committed what, not just through mainline)
-        lines = getpipeoutput(['git log --shortstat --date-order --pretty=format:"%%at %%aN" %s %s' % (getcommitrange('HEAD'), get_commit_time())]).split('\n')
-        lines.reverse()
-        files = 0; inserted = 0; deleted = 0
-        author = None
-        stamp = 0
-        for line in lines:
-            if len(line) == 0:
+                print('History was rewritten since %s, collecting full history' % state['watermark'])
+
+        if watermark is not None:
+            print('Collecting history since %s' % watermark)
+            for name in HISTORY_STATE:
+                setattr(self, name, state[name])
+            (tip, mainline) = self.collectHistory(watermark)
+            if conf['linear_linestats'] and tip is not None and mainline != watermark:
+                # the old mainline was merged into the new one, line statistics must be redone
+                print('%s is no longer on the first parent history, collecting full history' % watermark)
+                fresh = GitDataCollector()
+                for name in HISTORY_STATE:
+                    setattr(self, name, getattr(fresh, name))
+                watermark = None
+        if watermark is None:
+            (tip, mainline) = self.collectHistory()
+
+        # nothing new was walked, the saved state is still the current one
+        if tip is not None:
+            state = { 'watermark': tip, 'options': options }
+            for name in HISTORY_STATE:
+                state[name] = getattr(self, name)
+            self.cache['history'][key] = state
+
+    ##
+    # Walk the history once, newest first, and fill every per-commit aggregate.
+    # Only commits not reachable from watermark are walked.
+    # Returns the newest commit walked and the next commit of the first parent chain.
+    def collectHistory(self, watermark = None):
+        revs = [getcommitrange('HEAD', end = self.ref)] + get_commit_time_args()
+        if watermark is not None:
+            revs.append('^' + watermark)
+
+        history = [] # (stamp, author id, files, inserted, deleted, linestats, merge), newest first
+        trees = [] # (stamp, hash, first parent, tree, files delta), newest first
+        children = {} # hash -> number of commits having it as first parent
+        # the clock skew of the new commits is clamped from the newest commit
+        # walked so far, restored with the commit table when resuming
+        last_commit_stamp = self.last_commit_stamp
+        if len(self.commit_table) > 0:
+            last_commit_stamp = max(last_commit_stamp, max(self.commit_table.stamps))
+        tip = None
+        mainline = None
+        for commit in self.history.getCommits(revs):
+            if tip is None:
+                tip = commit.sha
+            merge = len(commit.parents) > 1
+            parent = (commit.parents + ('',))[0]
+            # the first parent chain starts at the first (newest) commit
+            if conf['linear_linestats']:
+                linestats = (mainline is None or commit.sha == mainline)
+                if linestats:
+                    mainline = parent
+            else:
+                linestats = not merge
+
+            identity = self.identities.getId(commit.author, commit.mail)
+            author = self.identities.authors[identity]
+            self.commit_table.add(commit.stamp, gettimezoneoffset(commit.timezone), identity, commit.files, commit.inserted, commit.deleted, linestats)
+            history.append((commit.stamp, author, commit.files, commit.inserted, commit.deleted, linestats, merge))
+            if not merge:
+                # merges would count the changes of the merged commits again
+                self.addFileChanges(commit.changes)
+            trees.append((commit.stamp, commit.sha, parent, commit.tree, commit.files_delta))
+            children[parent] = children.get(parent, 0) + 1
+
+        self.total_commits += len(history)
+
+        history.reverse()
+        self.addLineStats(history, last_commit_stamp)
+        trees.reverse()
+        self.addFileCounts(trees, children)
+        return (tip, mainline)
+
+    ##
+    # Compute the histograms of the commits from the commit table, a quarter
+    # of an hour or an author at a time rather than a commit at a time
+    def addHistograms(self):
+        table = self.commit_table
+        if len(table) == 0:
+            return
+
+        # First and last commit stamp (may be in any order because of cherry-picking and patches)
+        self.first_commit_stamp = min(table.stamps)
+        self.last_commit_stamp = max(table.stamps)
+
+        (quarters, dates) = table.getQuarters()
+        # (hour, day of week, month, year, year-week, year-month, date) of each quarter
+        fields = [(date.hour, date.weekday(), date.month, date.year, date.strftime('%Y-%W'), date.strftime('%Y-%m'), date.strftime('%Y-%m-%d')) for date in dates]
+
+        # activity
+        commits = table.count(quarters, len(dates))
+        for ((hour, day, month, yy, yyw, yymm, yymmdd), n) in izip(fields, commits):
+            self.activity_by_hour_of_day[hour] = self.activity_by_hour_of_day.get(hour, 0) + n
+            self.activity_by_day_of_week[day] = self.activity_by_day_of_week.get(day, 0) + n
+            if day not in self.activity_by_hour_of_week:
+                self.activity_by_hour_of_week[day] = {}
+            self.activity_by_hour_of_week[day][hour] = self.activity_by_hour_of_week[day].get(hour, 0) + n
+            self.activity_by_month_of_year[month] = self.activity_by_month_of_year.get(month, 0) + n
+            self.activity_by_year_week[yyw] = self.activity_by_year_week.get(yyw, 0) + n
+            self.commits_by_month[yymm] = self.commits_by_month.get(yymm, 0) + n
+            self.commits_by_year[yy] = self.commits_by_year.get(yy, 0) + n
+            self.active_days.add(yymmdd)
+        # most active hour, week
+        self.activity_by_hour_of_day_busiest = max(self.activity_by_hour_of_day.values())
+        self.activity_by_hour_of_week_busiest = max([max(hours.values()) for hours in self.activity_by_hour_of_week.values()])
+        self.activity_by_year_week_peak = max(self.activity_by_year_week.values())
+
+        # lines added and removed, of the commits counting for the lines of code
+        linestats = table.sumLineStats(quarters, len(dates), table.linestats)
+        inserted = table.sumLineStats(quarters, len(dates), table.inserted)
+        deleted = table.sumLineStats(quarters, len(dates), table.deleted)
+        for ((hour, day, month, yy, yyw, yymm, yymmdd), n, added, removed) in izip(fields, linestats, inserted, deleted):
+            if n == 0:
+                continue
+            self.lines_added_by_month[yymm] = self.lines_added_by_month.get(yymm, 0) + added
+            self.lines_removed_by_month[yymm] = self.lines_removed_by_month.get(yymm, 0) + removed
+            self.lines_added_by_year[yy] = self.lines_added_by_year.get(yy, 0) + added
+            self.lines_removed_by_year[yy] = self.lines_removed_by_year.get(yy, 0) + removed
+
+        # author and domain stats, an identity at a time
+        identities = self.identities
+        names = set() # authors as given by git, before merge_authors
+        commits = table.count(table.identities, len(identities))
+        (first, last) = table.getStampRange(table.identities, len(identities))
+        for (identity, n) in enumerate(commits):
+            if n == 0:
+                # only seen in the history of tags
                 continue
+            names.add(identities.names[identity])
+            id = identities.authors[identity]
+            author = identities.author_names[id]
+            if author not in self.authors:
+                self.authors[author] = { 'first_commit_stamp': first[identity], 'last_commit_stamp': last[identity], 'active_days': 0,
+                    'commits': self.author_commits[id], 'lines_added': self.author_lines_added[id], 'lines_removed': self.author_lines_removed[id] }
+            # commits may be in any date order because of cherry-picking and patches
+            self.authors[author]['first_commit_stamp'] = min(self.authors[author]['first_commit_stamp'], first[identity])
+            self.authors[author]['last_commit_stamp'] = max(self.authors[author]['last_commit_stamp'], last[identity])
 
-            # <stamp> <author>
-            if re.search('files? changed', line) is None:
-                pos = line.find(' ')
-                if pos != -1:
-                    try:
-                        oldstamp = stamp
-                        (stamp, author) = (int(line[:pos]), line[pos+1:])
-                        if author in conf['merge_authors']:
-                            author = conf['merge_authors'][author]
-                        if oldstamp > stamp:
-                            # clock skew, keep old timestamp to avoid having ugly graph
-                            stamp = oldstamp
-                        if author not in self.authors:
-                            self.authors[author] = { 'lines_added' : 0, 'lines_removed' : 0, 'commits' : 0}
-                        self.authors[author]['commits'] = self.authors[author].get('commits', 0) + 1
-                        self.authors[author]['lines_added'] = self.authors[author].get('lines_added', 0) + inserted
-                        self.authors[author]['lines_removed'] = self.authors[author].get('lines_removed', 0) + deleted
-                        if stamp not in self.changes_by_date_by_author:
-                            self.changes_by_date_by_author[stamp] = {}
-                        if author not in self.changes_by_date_by_author[stamp]:
-                            self.changes_by_date_by_author[stamp][author] = {}
-                        self.changes_by_date_by_author[stamp][author]['lines_added'] = self.authors[author]['lines_added']
-                        self.changes_by_date_by_author[stamp][author]['commits'] = self.authors[author]['commits']
-                        files, inserted, deleted = 0, 0, 0
-                    except ValueError:
-                        print('Warning: unexpected line "%s"' % line)
-                else:
-                    print('Warning: unexpected line "%s"' % line)
+            domain = identities.domain_names[identities.domains[identity]]
+            if domain not in self.domains:
+                self.domains[domain] = { 'commits': 0 }
+            self.domains[domain]['commits'] += n
+        self.total_authors = len(names)
+
+        # author of the month/year, active days, only counted once all are seen
+        active_days = {} # author -> dates
+        for ((quarter, identity), n) in table.countPairs(quarters, table.identities).items():
+            (hour, day, month, yy, yyw, yymm, yymmdd) = fields[quarter]
+            author = identities.author_names[identities.authors[identity]]
+            if yymm not in self.author_of_month:
+                self.author_of_month[yymm] = {}
+            self.author_of_month[yymm][author] = self.author_of_month[yymm].get(author, 0) + n
+            if yy not in self.author_of_year:
+                self.author_of_year[yy] = {}
+            self.author_of_year[yy][author] = self.author_of_year[yy].get(author, 0) + n
+            active_days.setdefault(author, set()).add(yymmdd)
+        for (author, days) in active_days.items():
+            self.authors[author]['active_days'] = len(days)
+
+        # timezone
+        self.commits_by_timezone = table.countTimezones()
+
+    ##
+    # Count the revisions and the lines inserted and deleted of the paths
+    # changed by a commit, given as the changes of a Commit
+    def addFileChanges(self, changes):
+        if len(changes) == 0:
+            return
+        for change in changes.split('\0'):
+            (inserted, deleted, path) = change.split('\t', 2)
+            self.file_revisions.add(path)
+            # binary files have no lines
+            if inserted != '-' and int(inserted) + int(deleted) > 0:
+                self.file_churn.add(path, int(inserted) + int(deleted))
+
+    ##
+    # Compute the number of files of each commit, oldest commit first, from the
+    # number of files of its first parent and the files added and deleted by it
+    def addFileCounts(self, trees, children):
+        files_in_tree = self.cache['files_in_tree']
+        cached = files_in_tree.getMany([tree for (stamp, rev, parent, tree, delta) in trees])
+
+        counts = {} # hash -> files, only kept until all children are done
+        for (stamp, rev, parent, tree, delta) in trees:
+            count = cached.get(tree)
+            if count is None:
+                if parent not in counts:
+                    # root commit, or first parent outside of the walked range
+                    counts[parent] = self.getFilesInCommit(parent)
+                count = counts[parent] + delta
+                files_in_tree[tree] = count
+            children[parent] -= 1
+            if children[parent] == 0:
+                counts.pop(parent, None)
+            if rev in children:
+                counts[rev] = count
+            self.files_by_stamp.append((stamp, count))
+
+    ##
+    # Number of files in the tree of a commit which is not part of the walked history
+    def getFilesInCommit(self, rev):
+        if len(rev) == 0:
+            return 0
+        tree = getpipeoutput(['git', 'rev-parse', '%s^{tree}' % rev])
+        count = self.cache['files_in_tree'].get(tree)
+        if count is None:
+            count = getnumoffilesfromrev((0, tree))[2]
+            self.cache['files_in_tree'][tree] = count
+        return count
+
+    ##
+    # Add line statistics and cumulative per-author statistics, oldest commit first,
+    # continuing from the commits already added, the newest of them at stamp
+    def addLineStats(self, history, stamp = 0):
+        # computation of lines of code by date is better done
+        # on a linear history, see collectHistory
+        total_lines = self.total_lines
+        authors = len(self.identities.author_names)
+        for totals in (self.author_commits, self.author_lines_added, self.author_lines_removed):
+            totals.extend([0] * (authors - len(totals)))
+        for series in (self.author_stamps, self.author_cumulated_lines, self.author_cumulated_commits):
+            series.extend([array('l') for i in range(len(series), authors)])
+        for (commitstamp, author, files, inserted, deleted, linestats, merge) in history:
+            if linestats:
+                total_lines += inserted
+                total_lines -= deleted
+                self.total_lines_added += inserted
+                self.total_lines_removed += deleted
+                self.lines_by_stamp.append((commitstamp, total_lines))
+
+            # Per-author statistics never count merges: we need to walk through
+            # every commit to know who committed what, not just through mainline
+            if merge:
+                inserted, deleted = 0, 0
+            # clock skew, keep old timestamp to avoid having ugly graph
+            if commitstamp > stamp:
+                stamp = commitstamp
+            self.author_commits[author] += 1
+            self.author_lines_added[author] += inserted
+            self.author_lines_removed[author] += deleted
+            stamps = self.author_stamps[author]
+            # the stamps of an author stay sorted, getCumulatedByAuthor merges them
+            author_stamp = stamp
+            if len(stamps) > 0 and stamps[-1] > author_stamp:
+                author_stamp = stamps[-1]
+            if len(stamps) > 0 and stamps[-1] == author_stamp:
+                # several commits at the same stamp, the last one counts
+                self.author_cumulated_lines[author][-1] = self.author_lines_added[author]
+                self.author_cumulated_commits[author][-1] = self.author_commits[author]
             else:
-                numbers = getstatsummarycounts(line);
-
-                if len(numbers) == 3:
-                    (files, inserted, deleted) = map(lambda el : int(el), numbers)
-                else:
-                    print('Warning: failed to handle line "%s"' % line)
-                    (files, inserted, deleted) = (0, 0, 0)
+                stamps.append(author_stamp)
+                self.author_cumulated_lines[author].append(self.author_lines_added[author])
+                self.author_cumulated_commits[author].append(self.author_commits[author])
+        self.total_lines = total_lines
 
     def refine(self):
         # authors
@@ -417,6 +613,29 @@ class GitDataCollector(DataCollector):
     def getAuthorInfo(self, author):
         return self.authors[author]
 
+    def getCumulatedByAuthor(self, authors):
+        columns = {} # author id -> column
+        for (column, author) in enumerate(authors):
+            id = self.identities.getAuthorId(author)
+            if id is not None:
+                columns[id] = column
+        lines = [0] * len(authors)
+        commits = [0] * len(authors)
+        lines_rows = Series(len(authors))
+        commits_rows = Series(len(authors))
+        # k-way merge of the stamps of every author, the stamps of each being
+        # sorted by addLineStats
+        merged = heapq.merge(*[izip(stamps, repeat(id), xrange(len(stamps))) for (id, stamps) in enumerate(self.author_stamps)])
+        for (stamp, changes) in groupby(merged, itemgetter(0)):
+            for (stamp, id, i) in changes:
+                column = columns.get(id)
+                if column is not None:
+                    lines[column] = self.author_cumulated_lines[id][i]
+                    commits[column] = self.author_cumulated_commits[id][i]
+            lines_rows.append(tuple([stamp] + lines))
+            commits_rows.append(tuple([stamp] + commits))
+        return (lines_rows, commits_rows)
+
     def getAuthors(self, limit = None):
         res = getkeyssortedbyvaluekey(self.authors, 'commits')
         res.reverse()
@@ -438,8 +657,8 @@ class GitDataCollector(DataCollector):
         return datetime.datetime.fromtimestamp(self.last_commit_stamp)
 
     def getTags(self):
-        lines = getpipeoutput(['git show-ref --tags', 'cut -d/ -f3'])
-        return lines.split('\n')
+        # "<hash> refs/tags/<tag>"
+        return [line.split('/')[2] for line in getpipestream(['git', 'show-ref', '--tags'])]
 
     def getTagDate(self, tag):
         return self.revToDate('tags/' + tag)
@@ -460,5 +679,5 @@ class GitDataCollector(DataCollector):
         return self.total_size
 
     def revToDate(self, rev):
-        stamp = int(getpipeoutput(['git log --pretty=format:%%at "%s" -n 1' % rev]))
+        stamp = int(getpipeoutput(['git', 'log', '--pretty=format:%at', rev, '-n', '1']))
         return datetime.datetime.fromtimestamp(stamp).strftime('%Y-%m-%d')
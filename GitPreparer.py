@@ -0,0 +1,182 @@
+__author__ = 'tho'
+
+import mmap
+import os
+import re
+import struct
+import time
+from glob import glob
+
+import common
+from common import getgitversion, getpipeoutput, getpipestream
+
+# Oldest git writing commit-graphs with changed-path Bloom filters
+COMMIT_GRAPH_VERSION = (2, 27)
+# Oldest git writing multi-pack-indexes
+MULTI_PACK_INDEX_VERSION = (2, 21)
+
+class GitPreparer:
+    """Prepares the objects of the repository in the current directory for the
+    history walks: a commit-graph with changed-path Bloom filters, so that
+    commits are not parsed from their objects, and a multi-pack-index, so that
+    objects are looked up once instead of in every pack. They are only written
+    when missing or stale, the commit-graph as a split chain to which newer
+    commits add a layer."""
+    def __init__(self):
+        self.objects = os.path.abspath(getpipeoutput(['git', 'rev-parse', '--git-path', 'objects']))
+
+    ##
+    # Write what is missing or stale, and print how much faster the walk of
+    # every commit got
+    def prepare(self):
+        version = self.getGitVersion()
+        commands = []
+        if version < COMMIT_GRAPH_VERSION:
+            print('Warning: git %d.%d does not write commit-graphs with Bloom filters, not preparing them' % version)
+        else:
+            state = self.getCommitGraphState()
+            if state == 'bloomless':
+                # the layers without Bloom filters are replaced, not added to
+                commands.append(('commit-graph with Bloom filters', ['git', 'commit-graph', 'write', '--reachable', '--changed-paths', '--split=replace']))
+            elif state != 'fresh':
+                commands.append(('%s commit-graph' % state, ['git', 'commit-graph', 'write', '--reachable', '--changed-paths', '--split']))
+        if version < MULTI_PACK_INDEX_VERSION:
+            print('Warning: git %d.%d does not write multi-pack-indexes, not preparing them' % version)
+        else:
+            state = self.getMultiPackIndexState()
+            if state != 'fresh':
+                commands.append(('%s multi-pack-index' % state, ['git', 'multi-pack-index', 'write']))
+        if len(commands) == 0:
+            print('Commit-graph and multi-pack-index are up to date')
+            return
+
+        (commits, before) = self.timeWalk()
+        for (name, args) in commands:
+            print('Writing %s...' % name)
+            getpipeoutput(args)
+            if common.external_commands[-1].status != 0:
+                print('Warning: failed to write %s' % name)
+        (commits, after) = self.timeWalk()
+        print('Walk of %d commits: %.2f secs before, %.2f secs after (%.1fx as fast)' % (commits, before, after, before / max(after, 0.001)))
+
+    def getGitVersion(self):
+        # "git version 2.39.2", or "git version 2.39.2.windows.1"
+        match = re.search(r'(\d+)\.(\d+)', getgitversion())
+        if match is None:
+            return (0, 0)
+        return (int(match.group(1)), int(match.group(2)))
+
+    ##
+    # Walk every commit, returns the commits walked and the seconds it took
+    def timeWalk(self):
+        start = time.time()
+        commits = getpipeoutput(['git', 'rev-list', '--all', '--count'])
+        return (int(commits or 0), time.time() - start)
+
+    ##
+    # Get whether the commit-graph is 'missing', 'bloomless' (lacks Bloom
+    # filters in any layer), 'stale' (lacks the commit of a ref) or 'fresh'
+    def getCommitGraphState(self):
+        info = os.path.join(self.objects, 'info')
+        chain = os.path.join(info, 'commit-graphs', 'commit-graph-chain')
+        if os.path.exists(chain):
+            f = open(chain, 'r')
+            paths = [os.path.join(info, 'commit-graphs', 'graph-%s.graph' % line.strip()) for line in f if len(line.strip()) > 0]
+            f.close()
+        elif os.path.exists(os.path.join(info, 'commit-graph')):
+            paths = [os.path.join(info, 'commit-graph')]
+        else:
+            return 'missing'
+        graphs = [self.readChunks(path, 'CGPH', 8) for path in paths]
+        if len(graphs) == 0 or None in graphs:
+            return 'missing'
+        if len([graph for graph in graphs if 'BIDX' not in graph[2]]) > 0:
+            return 'bloomless'
+        # a commit-graph holds the ancestors of its commits, the tips are enough
+        for tip in self.getTips():
+            if len([graph for graph in graphs if self.hasCommit(graph, tip)]) == 0:
+                return 'stale'
+        return 'fresh'
+
+    ##
+    # Get whether the multi-pack-index is 'missing', 'stale' (does not list
+    # the same packs as the pack directory) or 'fresh'. With a single pack,
+    # there is nothing to index.
+    def getMultiPackIndexState(self):
+        pack = os.path.join(self.objects, 'pack')
+        packs = set([os.path.basename(path) for path in glob(os.path.join(pack, '*.idx'))])
+        if len(packs) < 2:
+            return 'fresh'
+        midx = self.readChunks(os.path.join(pack, 'multi-pack-index'), 'MIDX', 12)
+        if midx is None:
+            return 'missing'
+        (data, hash_size, chunks) = midx
+        if 'PNAM' not in chunks:
+            return 'missing'
+        (start, end) = chunks['PNAM']
+        if set([name for name in data[start:end].split('\0') if len(name) > 0]) != packs:
+            return 'stale'
+        return 'fresh'
+
+    ##
+    # Get the commits the refs and HEAD point at, annotated tags peeled
+    def getTips(self):
+        tips = set()
+        for line in getpipestream(['git', 'for-each-ref', '--format=%(objecttype) %(objectname) %(*objecttype) %(*objectname)']):
+            fields = line.split()
+            if len(fields) >= 2 and fields[0] == 'commit':
+                tips.add(fields[1])
+            elif len(fields) == 4 and fields[2] == 'commit':
+                tips.add(fields[3])
+        head = getpipeoutput(['git', 'rev-parse', '--verify', '-q', 'HEAD^{commit}'])
+        if len(head) > 0:
+            tips.add(head)
+        return tips
+
+    ##
+    # Map a commit-graph or multi-pack-index file, whose header of the given
+    # size starts with signature, then the version, the hash version and the
+    # number of chunks. Returns (data, hash size, chunk id -> (start, end)),
+    # or None when the file is missing or not of that kind.
+    def readChunks(self, path, signature, header):
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            return None
+        finally:
+            f.close()
+        if data[0:4] != signature:
+            return None
+        count = ord(data[6])
+        # the table has an entry more, for the end of the last chunk
+        table = [struct.unpack('>4sQ', data[header + 12 * i:header + 12 * (i + 1)]) for i in range(0, count + 1)]
+        chunks = dict([(table[i][0], (table[i][1], table[i + 1][1])) for i in range(0, count)])
+        return (data, ord(data[5]) == 2 and 32 or 20, chunks)
+
+    ##
+    # Find a commit in a layer of the commit-graph, through its fanout table
+    # and its sorted list of hashes
+    def hasCommit(self, graph, sha):
+        (data, hash_size, chunks) = graph
+        if 'OIDF' not in chunks or 'OIDL' not in chunks or len(sha) != 2 * hash_size:
+            return False
+        oid = sha.decode('hex')
+        fanout = chunks['OIDF'][0]
+        first = ord(oid[0])
+        low = first > 0 and struct.unpack('>I', data[fanout + 4 * (first - 1):fanout + 4 * first])[0] or 0
+        high = struct.unpack('>I', data[fanout + 4 * first:fanout + 4 * (first + 1)])[0]
+        oids = chunks['OIDL'][0]
+        while low < high:
+            middle = (low + high) / 2
+            candidate = data[oids + middle * hash_size:oids + (middle + 1) * hash_size]
+            if candidate == oid:
+                return True
+            if candidate < oid:
+                low = middle + 1
+            else:
+                high = middle
+        return False
@@ -0,0 +1,103 @@
+__author__ = 'tho'
+
+import glob
+import hashlib
+import os
+import re
+import shlex
+import time
+from multiprocessing.pool import ThreadPool
+
+from common import addpoolusage, getpipeoutput, phase, writefile
+from config import conf, gnuplot_cmd
+
+# Hashes of the inputs of the images rendered in a report directory
+HASHES_FILE = 'graphs.cache'
+
+class GnuplotRenderer:
+    """Renders the .plot files of a report directory, running gnuplot on a
+    bounded pool, and only for the images whose .plot and .dat files changed
+    since they were rendered."""
+    def __init__(self, processes = None):
+        if processes is None:
+            processes = conf['processes']
+        self.processes = max(1, processes)
+
+    def render(self, path):
+        hashes = self.loadHashes(path)
+        todo = []
+        for plot in sorted(glob.glob(os.path.join(path, '*.plot'))):
+            (output, digest) = self.getInputs(plot)
+            if output is not None and hashes.get(output) == digest and os.path.exists(os.path.join(path, output)):
+                continue
+            hashes.pop(output, None)
+            todo.append((plot, output, digest))
+        if len(todo) == 0:
+            return
+
+        # the plots name their files relative to the report directory
+        os.chdir(path)
+        start = time.time()
+        processes = min(self.processes, len(todo))
+        pool = ThreadPool(processes)
+        results = pool.map(self.renderPlot, todo)
+        pool.close()
+        pool.join()
+        addpoolusage('charts', start, processes, sum([secs for (rendered, secs) in results]))
+
+        for ((plot, output, digest), (rendered, secs)) in zip(todo, results):
+            if rendered and output is not None:
+                hashes[output] = digest
+        self.saveHashes(path, hashes)
+
+    ##
+    # Run gnuplot on a plot, returns whether its image was written, and the
+    # seconds it took
+    def renderPlot(self, job):
+        (plot, output, digest) = job
+        start = time.time()
+        with phase('chart %s' % os.path.basename(plot)[:-len('.plot')]):
+            if output is not None:
+                try:
+                    os.remove(output)
+                except OSError:
+                    pass
+            out = getpipeoutput(shlex.split(gnuplot_cmd) + [plot])
+            if len(out) > 0:
+                print(out)
+        return (output is not None and os.path.exists(output), time.time() - start)
+
+    ##
+    # Get the image a plot writes, and a hash of the plot and the data files it reads
+    def getInputs(self, plot):
+        f = open(plot, 'r')
+        text = f.read()
+        f.close()
+        digest = hashlib.sha1(text)
+        for name in sorted(set(re.findall("'([^']+\.dat)'", text))):
+            try:
+                f = open(os.path.join(os.path.dirname(plot), name), 'rb')
+                digest.update(f.read())
+                f.close()
+            except IOError:
+                pass
+        output = re.search("set output '([^']+)'", text)
+        if output is None:
+            return (None, None)
+        return (output.group(1), digest.hexdigest())
+
+    def loadHashes(self, path):
+        hashes = {}
+        try:
+            f = open(os.path.join(path, HASHES_FILE), 'r')
+        except IOError:
+            return hashes
+        for line in f:
+            parts = line.rstrip('\n').split(' ', 1)
+            if len(parts) == 2:
+                hashes[parts[1]] = parts[0]
+        f.close()
+        return hashes
+
+    def saveHashes(self, path, hashes):
+        writefile(os.path.join(path, HASHES_FILE), ''.join(['%s %s\n' % (hashes[output], output) for output in sorted(hashes.keys())]))
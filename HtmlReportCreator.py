@@ -1,21 +1,50 @@
 __author__ = 'tho'
 
 import datetime
-import glob
-import shutil
+import hashlib
+import multiprocessing
+from cStringIO import StringIO
 
+from Downsampler import Downsampler
+from GnuplotRenderer import GnuplotRenderer
 from ReportCreator import ReportCreator
+from SvgRenderer import SvgRenderer
 from common import *
 from config import conf
 
+# The pages, built by the create<page>Page methods
+PAGES = ('Index', 'Activity', 'Authors', 'Files', 'Lines', 'Tags')
+
+# Commits from which the pages are built on a pool of processes: below, forking
+# and joining the pool for every report costs more than the pages take
+POOL_COMMITS = 100000
+
+# Stands for the time of generation in index.html, until the page is written
+GENERATED = '\0generated\0'
+
+# (report creator, data, path) while pages are built by a pool
+building = None
+
+def createpage(page):
+    """
+    Build one page, as a job of the pool of createPages(). Returns the graph
+    series of the page, the authors to plot for the authors page, and the
+    spans recorded while building it.
+    """
+    (creator, data, path) = building
+    creator.series = {}
+    creator.authors_to_plot = None
+    first = len(spans)
+    creator.createPage(page, data, path)
+    return (creator.series, creator.authors_to_plot, spans[first:])
+
 class HTMLReportCreator(ReportCreator):
     def create(self, data, path, branch_name = ''):
         ReportCreator.create(self, data, path)
         self.title = data.projectname
+        self.series = {} # graph -> rows of values, as written to its .dat file
 
-        if branch_name is not '':
-            branch_name = branch_name.replace('/', '_')
-            path += '-' + branch_name
+        path = self.getBranchPath(path, branch_name)
 
         try:
             os.makedirs(path)
@@ -32,12 +61,61 @@ class HTMLReportCreator(ReportCreator):
             for base in basedirs:
                 src = base + '/' + file
                 if os.path.exists(src):
-                    shutil.copyfile(src, path + '/' + file)
+                    f = open(src, 'rb')
+                    writefile(path + '/' + file, f.read())
+                    f.close()
                     break
             else:
                 print('Warning: "%s" not found, so not copied (searched: %s)' % (file, basedirs))
 
-        f = open(path + "/index.html", 'w')
+        with phase('pages'):
+            self.createPages(data, path)
+
+        with phase('graphs'):
+            self.createGraphs(path)
+
+    ##
+    # Build the pages, each into a buffer written out at once. They are built
+    # on a pool of forked processes for large histories, unless this is a
+    # process of a pool itself.
+    def createPages(self, data, path):
+        global building
+        self.authors_to_plot = []
+        processes = min(conf['processes'], len(PAGES))
+        if processes < 2 or data.getTotalCommits() < POOL_COMMITS or multiprocessing.current_process().daemon:
+            for page in PAGES:
+                self.createPage(page, data, path)
+            return
+
+        # versions are looked up once, before the processes are forked
+        getversion()
+        getgitversion()
+        if conf['charts'] != 'svg':
+            getgnuplotversion()
+        building = (self, data, path)
+        start = time.time()
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(createpage, PAGES)
+        finally:
+            pool.close()
+            pool.join()
+            building = None
+        busy = 0.0
+        for (series, authors_to_plot, page_spans) in results:
+            self.series.update(series)
+            if authors_to_plot is not None:
+                self.authors_to_plot = authors_to_plot
+            addspans(page_spans)
+            busy += sum([span.secs for span in page_spans if span.name.startswith('page ')])
+        addpoolusage('pages', start, processes, busy)
+
+    def createPage(self, page, data, path):
+        with phase('page %s' % page.lower()):
+            getattr(self, 'create%sPage' % page)(data, path)
+
+    def createIndexPage(self, data, path):
+        f = StringIO()
         format = '%Y-%m-%d %H:%M:%S'
         self.printHeader(f)
 
@@ -47,9 +125,13 @@ class HTMLReportCreator(ReportCreator):
 
         f.write('<dl>')
         f.write('<dt>Project name</dt><dd>%s</dd>' % (data.projectname))
-        f.write('<dt>Generated</dt><dd>%s (in %d seconds)</dd>' % (datetime.datetime.now().strftime(format), time.time() - data.getStampCreated()))
+        # volatile, left out of the fingerprint of the page
+        f.write('<dt>Generated</dt><dd>%s</dd>' % GENERATED)
+        tools = [getgitversion()]
+        if conf['charts'] != 'svg':
+            tools.append(getgnuplotversion())
         f.write('<dt>Generator</dt><dd><a href="http://gitstats.sourceforge.net/">GitStats</a> forked & improved '
-                '<a href="https://github.com/nguyentruongtho/gitstats">https://github.com/nguyentruongtho/gitstats</a> (version %s), %s, %s</dd>' % (getversion(), getgitversion(), getgnuplotversion()))
+                '<a href="https://github.com/nguyentruongtho/gitstats">https://github.com/nguyentruongtho/gitstats</a> (version %s), %s</dd>' % (getversion(), ', '.join(tools)))
         f.write('<dt>Report Period</dt><dd>%s to %s</dd>' % (data.getFirstCommitDate().strftime(format), data.getLastCommitDate().strftime(format)))
         f.write('<dt>Age</dt><dd>%d days, %d active days (%3.2f%%)</dd>' % (data.getCommitDeltaDays(), len(data.getActiveDays()), (100.0 * len(data.getActiveDays()) / data.getCommitDeltaDays())))
         f.write('<dt>Total Files</dt><dd>%s</dd>' % data.getTotalFiles())
@@ -71,11 +153,12 @@ class HTMLReportCreator(ReportCreator):
         f.write('</dl>')
 
         f.write('</div></body>\n</html>')
-        f.close()
+        page = f.getvalue()
+        generated = '%s (in %d seconds)' % (datetime.datetime.now().strftime(format), time.time() - data.getStampCreated())
+        writefile(path + '/index.html', page.replace(GENERATED, generated), hashlib.sha1(page).hexdigest())
 
-        ###
-        # Activity
-        f = open(path + '/activity.html', 'w')
+    def createActivityPage(self, data, path):
+        f = StringIO()
         self.printHeader(f)
         f.write('<h1>Activity</h1>')
         self.printNav(f, data)
@@ -124,16 +207,12 @@ class HTMLReportCreator(ReportCreator):
         for i in range(0, 24):
             f.write('<th>%d</th>' % i)
         f.write('</tr>\n<tr><th>Commits</th>')
-        fp = open(path + '/hour_of_day.dat', 'w')
         for i in range(0, 24):
             if i in hour_of_day:
                 r = 127 + int((float(hour_of_day[i]) / data.activity_by_hour_of_day_busiest) * 128)
                 f.write('<td style="background-color: rgb(%d, 0, 0)">%d</td>' % (r, hour_of_day[i]))
-                fp.write('%d %d\n' % (i, hour_of_day[i]))
             else:
                 f.write('<td>0</td>')
-                fp.write('%d 0\n' % i)
-        fp.close()
         f.write('</tr>\n<tr><th>%</th>')
         total_commits = data.getTotalCommits()
         for i in range(0, 24):
@@ -143,26 +222,20 @@ class HTMLReportCreator(ReportCreator):
             else:
                 f.write('<td>0.00</td>')
         f.write('</tr></table>')
-        f.write('<img src="hour_of_day.png" alt="Hour of Day" />')
-        fg = open(path + '/hour_of_day.dat', 'w')
-        for i in range(0, 24):
-            if i in hour_of_day:
-                fg.write('%d %d\n' % (i + 1, hour_of_day[i]))
-            else:
-                fg.write('%d 0\n' % (i + 1))
-        fg.close()
+        f.write('<img src="%s" alt="Hour of Day" />' % self.getImageFile('hour_of_day'))
+        self.series['hour_of_day'] = [(i + 1, hour_of_day.get(i, 0)) for i in range(0, 24)]
 
         # Day of Week
         f.write(html_header(2, 'Day of Week'))
         day_of_week = data.getActivityByDayOfWeek()
         f.write('<div class="vtable"><table class="table">')
         f.write('<tr><th>Day</th><th>Total (%)</th></tr>')
-        fp = open(path + '/day_of_week.dat', 'w')
+        self.series['day_of_week'] = []
         for d in range(0, 7):
             commits = 0
             if d in day_of_week:
                 commits = day_of_week[d]
-            fp.write('%d %s %d\n' % (d + 1, WEEKDAYS[d], commits))
+            self.series['day_of_week'].append((d + 1, WEEKDAYS[d], commits))
             f.write('<tr>')
             f.write('<th>%s</th>' % (WEEKDAYS[d]))
             if d in day_of_week:
@@ -171,8 +244,7 @@ class HTMLReportCreator(ReportCreator):
                 f.write('<td>0</td>')
             f.write('</tr>')
         f.write('</table></div>')
-        f.write('<img src="day_of_week.png" alt="Day of Week" />')
-        fp.close()
+        f.write('<img src="%s" alt="Day of Week" />' % self.getImageFile('day_of_week'))
 
         # Hour of Week
         f.write(html_header(2, 'Hour of Week'))
@@ -205,7 +277,7 @@ class HTMLReportCreator(ReportCreator):
         f.write(html_header(2, 'Month of Year'))
         f.write('<div class="vtable"><table class="table">')
         f.write('<tr><th>Month</th><th>Commits (%)</th></tr>')
-        fp = open (path + '/month_of_year.dat', 'w')
+        self.series['month_of_year'] = []
         for mm in range(1, 13):
             commits = 0
             if mm in data.activity_by_month_of_year:
@@ -215,10 +287,9 @@ class HTMLReportCreator(ReportCreator):
             if total_commits > 0:
                 f.write('<tr><td>%d</td><td>%d (%.2f %%)</td></tr>' % (mm, commits, (100.0 * commits) / total_commits))
 
-            fp.write('%d %d\n' % (mm, commits))
-        fp.close()
+            self.series['month_of_year'].append((mm, commits))
         f.write('</table></div>')
-        f.write('<img src="month_of_year.png" alt="Month of Year" />')
+        f.write('<img src="%s" alt="Month of Year" />' % self.getImageFile('month_of_year'))
 
         # Commits by year/month
         f.write(html_header(2, 'Commits by year/month'))
@@ -226,11 +297,8 @@ class HTMLReportCreator(ReportCreator):
         for yymm in reversed(sorted(data.commits_by_month.keys())):
             f.write('<tr><td>%s</td><td>%d</td><td>%d</td><td>%d</td></tr>' % (yymm, data.commits_by_month.get(yymm,0), data.lines_added_by_month.get(yymm,0), data.lines_removed_by_month.get(yymm,0)))
         f.write('</table></div>')
-        f.write('<img src="commits_by_year_month.png" alt="Commits by year/month" />')
-        fg = open(path + '/commits_by_year_month.dat', 'w')
-        for yymm in sorted(data.commits_by_month.keys()):
-            fg.write('%s %s\n' % (yymm, data.commits_by_month[yymm]))
-        fg.close()
+        f.write('<img src="%s" alt="Commits by year/month" />' % self.getImageFile('commits_by_year_month'))
+        self.series['commits_by_year_month'] = [(yymm, data.commits_by_month[yymm]) for yymm in sorted(data.commits_by_month.keys())]
 
         # Commits by year
         f.write(html_header(2, 'Commits by Year'))
@@ -241,11 +309,8 @@ class HTMLReportCreator(ReportCreator):
                 f.write('<tr><td>%s</td><td>%d (%.2f%%)</td><td>%d</td><td>%d</td></tr>' %
                         (yy, data.commits_by_year.get(yy,0), (100.0 * data.commits_by_year.get(yy,0)) / total_commits, data.lines_added_by_year.get(yy,0), data.lines_removed_by_year.get(yy,0)))
         f.write('</table></div>')
-        f.write('<img src="commits_by_year.png" alt="Commits by Year" />')
-        fg = open(path + '/commits_by_year.dat', 'w')
-        for yy in sorted(data.commits_by_year.keys()):
-            fg.write('%d %d\n' % (yy, data.commits_by_year[yy]))
-        fg.close()
+        f.write('<img src="%s" alt="Commits by Year" />' % self.getImageFile('commits_by_year'))
+        self.series['commits_by_year'] = [(yy, data.commits_by_year[yy]) for yy in sorted(data.commits_by_year.keys())]
 
         # Commits by timezone
         commits_by_timezone = data.commits_by_timezone.values()
@@ -261,11 +326,11 @@ class HTMLReportCreator(ReportCreator):
             f.write('</tr></table>')
 
         f.write('</div></body></html>')
-        f.close()
+        writefile(path + '/activity.html', f.getvalue())
 
-        ###
-        # Authors
-        f = open(path + '/authors.html', 'w')
+    def createAuthorsPage(self, data, path):
+        f = StringIO()
+        total_commits = data.getTotalCommits()
         self.printHeader(f)
 
         f.write('<h1>Authors</h1>')
@@ -278,7 +343,7 @@ class HTMLReportCreator(ReportCreator):
         f.write('<tr><th>Author</th><th>Commits (%)</th><th>+ lines</th><th>- lines</th><th>First commit</th><th>Last commit</th><th class="unsortable">Age</th><th>Active days</th><th># by commits</th></tr>')
         for author in data.getAuthors(conf['max_authors']):
             info = data.getAuthorInfo(author)
-            f.write('<tr><td>%s</td><td>%d (%.2f%%)</td><td>%d</td><td>%d</td><td>%s</td><td>%s</td><td>%s</td><td>%d</td><td>%d</td></tr>' % (author, info['commits'], info['commits_frac'], info['lines_added'], info['lines_removed'], info['date_first'], info['date_last'], info['timedelta'], len(info['active_days']), info['place_by_commits']))
+            f.write('<tr><td>%s</td><td>%d (%.2f%%)</td><td>%d</td><td>%d</td><td>%s</td><td>%s</td><td>%s</td><td>%d</td><td>%d</td></tr>' % (author, info['commits'], info['commits_frac'], info['lines_added'], info['lines_removed'], info['date_first'], info['date_last'], info['timedelta'], info['active_days'], info['place_by_commits']))
         f.write('</table>')
 
         allauthors = data.getAuthors()
@@ -287,46 +352,24 @@ class HTMLReportCreator(ReportCreator):
             f.write('<p class="moreauthors">These didn\'t make it to the top: %s</p>' % ', '.join(rest))
 
         f.write(html_header(2, 'Cumulative Added Lines of Code per Author'))
-        f.write('<img src="lines_of_code_by_author.png" alt="Lines of code per Author" />')
+        f.write('<img src="%s" alt="Lines of code per Author" />' % self.getImageFile('lines_of_code_by_author'))
         if len(allauthors) > conf['max_authors']:
             f.write('<p class="moreauthors">Only top %d authors shown</p>' % conf['max_authors'])
 
         f.write(html_header(2, 'Commits per Author'))
-        f.write('<img src="commits_by_author.png" alt="Commits per Author" />')
+        f.write('<img src="%s" alt="Commits per Author" />' % self.getImageFile('commits_by_author'))
         if len(allauthors) > conf['max_authors']:
             f.write('<p class="moreauthors">Only top %d authors shown</p>' % conf['max_authors'])
 
-        fgl = open(path + '/lines_of_code_by_author.dat', 'w')
-        fgc = open(path + '/commits_by_author.dat', 'w')
-
-        lines_by_authors = {} # cumulated added lines by
-        # author. to save memory,
-        # changes_by_date_by_author[stamp][author] is defined
-        # only at points where author commits.
-        # lines_by_authors allows us to generate all the
-        # points in the .dat file.
-
         # Don't rely on getAuthors to give the same order each
         # time. Be robust and keep the list in a variable.
-        commits_by_authors = {} # cumulated added lines by
-
         self.authors_to_plot = data.getAuthors(conf['max_authors'])
-        for author in self.authors_to_plot:
-            lines_by_authors[author] = 0
-            commits_by_authors[author] = 0
-        for stamp in sorted(data.changes_by_date_by_author.keys()):
-            fgl.write('%d' % stamp)
-            fgc.write('%d' % stamp)
-            for author in self.authors_to_plot:
-                if author in data.changes_by_date_by_author[stamp].keys():
-                    lines_by_authors[author] = data.changes_by_date_by_author[stamp][author]['lines_added']
-                    commits_by_authors[author] = data.changes_by_date_by_author[stamp][author]['commits']
-                fgl.write(' %d' % lines_by_authors[author])
-                fgc.write(' %d' % commits_by_authors[author])
-            fgl.write('\n')
-            fgc.write('\n')
-        fgl.close()
-        fgc.close()
+        # a row per commit, downsampled as they are read
+        downsampler = Downsampler()
+        (lines_by_author, commits_by_author) = data.getCumulatedByAuthor(self.authors_to_plot)
+        self.series['lines_of_code_by_author'] = downsampler.downsample(lines_by_author)
+        self.series['commits_by_author'] = downsampler.downsample(commits_by_author)
+        del lines_by_author, commits_by_author
 
         # Authors :: Author of Month
         f.write(html_header(2, 'Author of Month'))
@@ -359,7 +402,7 @@ class HTMLReportCreator(ReportCreator):
         domains_by_commits.reverse() # most first
         f.write('<div class="vtable"><table class="table">')
         f.write('<tr><th>Domains</th><th>Total (%)</th></tr>')
-        fp = open(path + '/domains.dat', 'w')
+        self.series['domains'] = []
         n = 0
         for domain in domains_by_commits:
             if n == conf['max_domains']:
@@ -367,18 +410,16 @@ class HTMLReportCreator(ReportCreator):
             commits = 0
             n += 1
             info = data.getDomainInfo(domain)
-            fp.write('%s %d %d\n' % (domain, n , info['commits']))
+            self.series['domains'].append((domain, n, info['commits']))
             f.write('<tr><th>%s</th><td>%d (%.2f%%)</td></tr>' % (domain, info['commits'], (100.0 * info['commits'] / total_commits)))
         f.write('</table></div>')
-        f.write('<img src="domains.png" alt="Commits by Domains" />')
-        fp.close()
+        f.write('<img src="%s" alt="Commits by Domains" />' % self.getImageFile('domains'))
 
         f.write('</div></body></html>')
-        f.close()
+        writefile(path + '/authors.html', f.getvalue())
 
-        ###
-        # Files
-        f = open(path + '/files.html', 'w')
+    def createFilesPage(self, data, path):
+        f = StringIO()
         self.printHeader(f)
         f.write('<h1>Files</h1>')
         self.printNav(f, data)
@@ -397,17 +438,12 @@ class HTMLReportCreator(ReportCreator):
 
         # use set to get rid of duplicate/unnecessary entries
         files_by_date = set()
-        for stamp in sorted(data.files_by_stamp.keys()):
-            files_by_date.add('%s %d' % (datetime.datetime.fromtimestamp(stamp).strftime('%Y-%m-%d'), data.files_by_stamp[stamp]))
+        for (stamp, files) in data.files_by_stamp:
+            files_by_date.add('%s %d' % (datetime.datetime.fromtimestamp(stamp).strftime('%Y-%m-%d'), files))
 
-        fg = open(path + '/files_by_date.dat', 'w')
-        for line in sorted(list(files_by_date)):
-            fg.write('%s\n' % line)
-        #for stamp in sorted(data.files_by_stamp.keys()):
-        #    fg.write('%s %d\n' % (datetime.datetime.fromtimestamp(stamp).strftime('%Y-%m-%d'), data.files_by_stamp[stamp]))
-        fg.close()
+        self.series['files_by_date'] = [tuple(line.split(' ')) for line in sorted(list(files_by_date))]
 
-        f.write('<img src="files_by_date.png" alt="Files by Date" />')
+        f.write('<img src="%s" alt="Files by Date" />' % self.getImageFile('files_by_date'))
 
         #f.write('<h2>Average file size by date</h2>')
 
@@ -424,12 +460,32 @@ class HTMLReportCreator(ReportCreator):
             f.write('<tr><td>%s</td><td>%d (%.2f%%)</td><td>%d (%.2f%%)</td><td>%d</td></tr>' % (ext, files, (100.0 * files) / data.getTotalFiles(), lines, loc_percentage, lines / files))
         f.write('</table>')
 
+        # Files :: Largest Files
+        f.write(html_header(2, 'Largest Files'))
+        f.write('<table class="sortable table table-bordered" id="largest"><tr><th>File</th><th>Lines</th><th>Size (bytes)</th></tr>')
+        for (lines, size, fullpath) in data.largest_files:
+            f.write('<tr><td>%s</td><td>%d</td><td>%d</td></tr>' % (fullpath, lines, size))
+        f.write('</table>')
+
+        # Files :: Files With Most Revisions, Files With Most Churn
+        for (title, id, header, counter) in (('Files With Most Revisions', 'revisions', 'Revisions', data.file_revisions),
+                ('Files With Most Churn', 'churn', 'Lines added and removed', data.file_churn)):
+            f.write(html_header(2, title))
+            f.write('<table class="sortable table table-bordered" id="%s"><tr><th>File</th><th>%s</th></tr>' % (id, header))
+            top = counter.getTop(conf['max_files'])
+            for (fullpath, count, error) in top:
+                f.write('<tr><td>%s</td><td>%d</td></tr>' % (fullpath, count))
+            f.write('</table>')
+            # the files shown may all have been counted exactly even so
+            error = max([0] + [error for (fullpath, count, error) in top])
+            if error > 0:
+                f.write('<p class="moreauthors">Only %d files were counted at a time, the counts are at most %d too high</p>' % (counter.capacity, error))
+
         f.write('</div></body></html>')
-        f.close()
+        writefile(path + '/files.html', f.getvalue())
 
-        ###
-        # Lines
-        f = open(path + '/lines.html', 'w')
+    def createLinesPage(self, data, path):
+        f = StringIO()
         self.printHeader(f)
         f.write('<h1>Lines</h1>')
         self.printNav(f, data)
@@ -439,19 +495,15 @@ class HTMLReportCreator(ReportCreator):
         f.write('</dl>\n')
 
         f.write(html_header(2, 'Lines of Code'))
-        f.write('<img src="lines_of_code.png" />')
+        f.write('<img src="%s" />' % self.getImageFile('lines_of_code'))
 
-        fg = open(path + '/lines_of_code.dat', 'w')
-        for stamp in sorted(data.changes_by_date.keys()):
-            fg.write('%d %d\n' % (stamp, data.changes_by_date[stamp]['lines']))
-        fg.close()
+        self.series['lines_of_code'] = Downsampler().downsample(data.lines_by_stamp)
 
         f.write('</div></body></html>')
-        f.close()
+        writefile(path + '/lines.html', f.getvalue())
 
-        ###
-        # tags.html
-        f = open(path + '/tags.html', 'w')
+    def createTagsPage(self, data, path):
+        f = StringIO()
         self.printHeader(f)
         f.write('<h1>Tags</h1>')
         self.printNav(f, data)
@@ -475,15 +527,24 @@ class HTMLReportCreator(ReportCreator):
         f.write('</table>')
 
         f.write('</div></body></html>')
-        f.close()
+        writefile(path + '/tags.html', f.getvalue())
 
-        self.createGraphs(path)
+    def getImageFile(self, name):
+        if conf['charts'] == 'svg':
+            return name + '.svg'
+        return name + '.png'
 
     def createGraphs(self, path):
         print('Generating graphs...')
+        if conf['charts'] == 'svg':
+            self.createSvgGraphs(path)
+            return
+
+        for (name, rows) in self.series.items():
+            writefile(path + '/%s.dat' % name, ''.join([' '.join([str(value) for value in row]) + '\n' for row in rows]))
 
         # hour of day
-        f = open(path + '/hour_of_day.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -495,10 +556,10 @@ set grid y
 set ylabel "Commits"
 plot 'hour_of_day.dat' using 1:2:(0.5) w boxes fs solid
 """)
-        f.close()
+        writefile(path + '/hour_of_day.plot', f.getvalue())
 
         # day of week
-        f = open(path + '/day_of_week.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -510,10 +571,10 @@ set grid y
 set ylabel "Commits"
 plot 'day_of_week.dat' using 1:3:(0.5):xtic(2) w boxes fs solid
 """)
-        f.close()
+        writefile(path + '/day_of_week.plot', f.getvalue())
 
         # Domains
-        f = open(path + '/domains.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -525,10 +586,10 @@ set grid y
 set ylabel "Commits"
 plot 'domains.dat' using 2:3:(0.5) with boxes fs solid, '' using 2:3:1 with labels rotate by 45 offset 0,1
 """)
-        f.close()
+        writefile(path + '/domains.plot', f.getvalue())
 
         # Month of Year
-        f = open(path + '/month_of_year.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -540,10 +601,10 @@ set grid y
 set ylabel "Commits"
 plot 'month_of_year.dat' using 1:2:(0.5) w boxes fs solid
 """)
-        f.close()
+        writefile(path + '/month_of_year.plot', f.getvalue())
 
         # commits_by_year_month
-        f = open(path + '/commits_by_year_month.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -558,10 +619,10 @@ set grid y
 set ylabel "Commits"
 plot 'commits_by_year_month.dat' using 1:2:(0.5) w boxes fs solid
 """)
-        f.close()
+        writefile(path + '/commits_by_year_month.plot', f.getvalue())
 
         # commits_by_year
-        f = open(path + '/commits_by_year.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -573,10 +634,10 @@ set ylabel "Commits"
 set yrange [0:]
 plot 'commits_by_year.dat' using 1:2:(0.5) w boxes fs solid
 """)
-        f.close()
+        writefile(path + '/commits_by_year.plot', f.getvalue())
 
         # Files by date
-        f = open(path + '/files_by_date.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -592,10 +653,10 @@ set ytics autofreq
 set bmargin 6
 plot 'files_by_date.dat' using 1:2 w steps
 """)
-        f.close()
+        writefile(path + '/files_by_date.plot', f.getvalue())
 
         # Lines of Code
-        f = open(path + '/lines_of_code.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -610,10 +671,10 @@ set xtics rotate
 set bmargin 6
 plot 'lines_of_code.dat' using 1:2 w lines
 """)
-        f.close()
+        writefile(path + '/lines_of_code.plot', f.getvalue())
 
         # Lines of Code Added per author
-        f = open(path + '/lines_of_code_by_author.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -637,10 +698,10 @@ plot """
         f.write(", ".join(plots))
         f.write('\n')
 
-        f.close()
+        writefile(path + '/lines_of_code_by_author.plot', f.getvalue())
 
         # Commits per author
-        f = open(path + '/commits_by_author.plot', 'w')
+        f = StringIO()
         f.write(GNUPLOT_COMMON)
         f.write(
 """
@@ -664,14 +725,39 @@ plot """
         f.write(", ".join(plots))
         f.write('\n')
 
-        f.close()
-
-        os.chdir(path)
-        files = glob.glob(path + '/*.plot')
-        for f in files:
-            out = getpipeoutput([gnuplot_cmd + ' "%s"' % f])
-            if len(out) > 0:
-                print(out)
+        writefile(path + '/commits_by_author.plot', f.getvalue())
+
+        GnuplotRenderer().render(path)
+
+    ##
+    # Draw the same graphs as createGraphs, as SVG, without running gnuplot
+    def createSvgGraphs(self, path):
+        svg = SvgRenderer(path)
+        for (name, ylabel) in (('hour_of_day', 'Commits'), ('month_of_year', 'Commits'), ('commits_by_year', 'Commits'), ('commits_by_year_month', 'Commits')):
+            rows = self.series[name]
+            with phase('chart %s' % name):
+                svg.renderBoxes(name, [row[1] for row in rows], [str(row[0]) for row in rows], ylabel, name == 'commits_by_year_month')
+        rows = self.series['day_of_week']
+        with phase('chart day_of_week'):
+            svg.renderBoxes('day_of_week', [row[2] for row in rows], [row[1] for row in rows], 'Commits')
+        rows = self.series['domains']
+        with phase('chart domains'):
+            svg.renderBoxes('domains', [row[2] for row in rows], [row[0] for row in rows], 'Commits', True)
+
+        rows = self.series['files_by_date']
+        stamps = [time.mktime(datetime.datetime.strptime(row[0], '%Y-%m-%d').timetuple()) for row in rows]
+        with phase('chart files_by_date'):
+            svg.renderLines('files_by_date', stamps, [(None, [int(row[1]) for row in rows])], 'Files', True)
+        rows = self.series['lines_of_code']
+        with phase('chart lines_of_code'):
+            svg.renderLines('lines_of_code', [row[0] for row in rows], [(None, [row[1] for row in rows])], 'Lines')
+
+        svg.height = 480
+        for (name, ylabel) in (('lines_of_code_by_author', 'Lines'), ('commits_by_author', 'Commits')):
+            rows = self.series[name]
+            series = [(author, [row[i + 1] for row in rows]) for (i, author) in enumerate(self.authors_to_plot)]
+            with phase('chart %s' % name):
+                svg.renderLines(name, [row[0] for row in rows], series, ylabel)
 
     def printHeader(self, f, title = ''):
         f.write(
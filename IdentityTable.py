@@ -0,0 +1,49 @@
+__author__ = 'tho'
+
+from array import array
+
+from config import conf
+
+class IdentityTable:
+    """Integer ids of the identities (name, e-mail) of commits, as given by git
+    after .mailmap, of their authors after merge_authors, and of their e-mail
+    domains. Each identity is resolved once, the first time it is seen."""
+    def __init__(self):
+        self.ids = {} # (name, mail) -> identity id
+        self.names = [] # identity id -> name as given by git
+        self.authors = array('i') # identity id -> author id
+        self.domains = array('i') # identity id -> domain id
+        self.author_names = [] # author id -> author
+        self.author_ids = {} # author -> author id
+        self.domain_names = [] # domain id -> domain
+        self.domain_ids = {} # domain -> domain id
+
+    def __len__(self):
+        return len(self.names)
+
+    ##
+    # Get the id of an identity, adding it when it is new
+    def getId(self, name, mail):
+        id = self.ids.get((name, mail))
+        if id is None:
+            id = self.ids[(name, mail)] = len(self.names)
+            self.names.append(name)
+            author = name
+            if author in conf['merge_authors']:
+                author = conf['merge_authors'][author]
+            self.authors.append(self.intern(self.author_names, self.author_ids, author))
+            domain = '?'
+            if mail.find('@') != -1:
+                domain = mail.rsplit('@', 1)[1]
+            self.domains.append(self.intern(self.domain_names, self.domain_ids, domain))
+        return id
+
+    def intern(self, names, ids, name):
+        id = ids.get(name)
+        if id is None:
+            id = ids[name] = len(names)
+            names.append(name)
+        return id
+
+    def getAuthorId(self, author):
+        return self.author_ids.get(author)
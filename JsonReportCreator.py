@@ -0,0 +1,116 @@
+__author__ = 'tho'
+
+import json
+import os
+
+from ReportCreator import ReportCreator
+from common import writefile
+from config import conf
+
+class JSONReportCreator(ReportCreator):
+    """Writes the statistics of a branch as one JSON document, stats.json,
+    in the directory the HTML report would be in, without drawing anything."""
+    def create(self, data, path, branch_name = ''):
+        ReportCreator.create(self, data, path)
+
+        path = self.getBranchPath(path, branch_name)
+        try:
+            os.makedirs(path)
+        except OSError:
+            pass
+        if not os.path.isdir(path):
+            print('FATAL: Unable to create output folder')
+
+        report = {
+            'project': data.projectname,
+            'branch': branch_name,
+            'time_begin': conf['time_begin'],
+            'time_end': conf['time_end'],
+            'general': self.getGeneral(data),
+            'activity': self.getActivity(data),
+            'authors': self.getAuthors(data),
+            'author_of_month': data.author_of_month,
+            'author_of_year': data.author_of_year,
+            'domains': dict([(domain, data.getDomainInfo(domain)['commits']) for domain in data.getDomains()]),
+            'extensions': data.extensions,
+            'files': self.getFiles(data),
+            'tags': self.getTags(data),
+            'lines': self.getLines(data),
+        }
+        # keys are sorted so that an unchanged report is not rewritten
+        writefile(path + '/stats.json', json.dumps(report, sort_keys = True, separators = (',', ':')))
+
+    def getGeneral(self, data):
+        return {
+            'first_commit_stamp': data.first_commit_stamp,
+            'last_commit_stamp': data.last_commit_stamp,
+            'age_days': data.getCommitDeltaDays(),
+            'active_days': len(data.getActiveDays()),
+            'total_files': data.getTotalFiles(),
+            'total_lines': data.getTotalLOC(),
+            'total_lines_added': data.total_lines_added,
+            'total_lines_removed': data.total_lines_removed,
+            'total_commits': data.getTotalCommits(),
+            'total_authors': data.getTotalAuthors(),
+            'total_size': data.getTotalSize(),
+        }
+
+    def getActivity(self, data):
+        return {
+            'hour_of_day': [data.getActivityByHourOfDay().get(hour, 0) for hour in range(0, 24)],
+            'day_of_week': [data.getActivityByDayOfWeek().get(day, 0) for day in range(0, 7)],
+            'month_of_year': [data.activity_by_month_of_year.get(month, 0) for month in range(1, 13)],
+            'hour_of_week': [[data.activity_by_hour_of_week.get(day, {}).get(hour, 0) for hour in range(0, 24)] for day in range(0, 7)],
+            'year_week': data.activity_by_year_week,
+            'commits_by_month': data.commits_by_month,
+            'commits_by_year': data.commits_by_year,
+            'lines_added_by_month': data.lines_added_by_month,
+            'lines_added_by_year': data.lines_added_by_year,
+            'lines_removed_by_month': data.lines_removed_by_month,
+            'lines_removed_by_year': data.lines_removed_by_year,
+            'commits_by_timezone': data.commits_by_timezone,
+        }
+
+    def getAuthors(self, data):
+        authors = {}
+        for author in data.getAuthors():
+            info = data.getAuthorInfo(author)
+            authors[author] = {
+                'commits': info['commits'],
+                'lines_added': info['lines_added'],
+                'lines_removed': info['lines_removed'],
+                'first_commit_stamp': info['first_commit_stamp'],
+                'last_commit_stamp': info['last_commit_stamp'],
+                'active_days': info['active_days'],
+                'place_by_commits': info['place_by_commits'],
+            }
+        return authors
+
+    def getTags(self, data):
+        tags = {}
+        for (tag, info) in data.tags.items():
+            tags[tag] = { 'stamp': info['stamp'], 'hash': info['hash'], 'commits': info['commits'], 'authors': info['authors'] }
+        return tags
+
+    ##
+    # The files counted the most, the counts of a path being at most its error
+    # too high once more paths than the counters were seen
+    def getFiles(self, data):
+        return {
+            'largest': [{ 'path': path, 'lines': lines, 'size': size } for (lines, size, path) in data.largest_files],
+            'most_revisions': [{ 'path': path, 'revisions': count, 'error': error } for (path, count, error) in data.file_revisions.getTop(conf['max_files'])],
+            'most_churn': [{ 'path': path, 'lines': count, 'error': error } for (path, count, error) in data.file_churn.getTop(conf['max_files'])],
+        }
+
+    ##
+    # Series of (stamp, value) rows, a row per commit
+    def getLines(self, data):
+        authors = data.getAuthors(conf['max_authors'])
+        (lines_by_author, commits_by_author) = data.getCumulatedByAuthor(authors)
+        return {
+            'lines_of_code': list(data.lines_by_stamp),
+            'files': list(data.files_by_stamp),
+            'authors': authors,
+            'lines_of_code_by_author': list(lines_by_author),
+            'commits_by_author': list(commits_by_author),
+        }
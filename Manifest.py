@@ -0,0 +1,56 @@
+__author__ = 'tho'
+
+import fcntl
+import json
+import os
+import time
+
+from common import writefile
+
+# Name of the manifest, at the root of the output
+MANIFEST_FILE = 'manifest.json'
+
+class Manifest:
+    """Index of the reports of an output directory, so that the web pages find
+    them without listing directories: every report by path, and the latest
+    report of each repository, window and branch. It is updated by reading,
+    changing and renaming it over, under a lock shared by the processes
+    generating reports in parallel."""
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_FILE)
+
+    ##
+    # Add a report, or update it when its path is already in the manifest.
+    # window is the output suffix of the report, '' for all-time reports.
+    def addReport(self, repository, branch, window, time_begin, time_end, path, format):
+        path = os.path.relpath(path, self.root)
+        report = { 'repository': repository, 'branch': branch, 'window': window or 'all', 'time_begin': time_begin,
+            'time_end': time_end, 'path': path, 'format': format, 'generated': int(time.time()) }
+
+        lock = open(self.path + '.lock', 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            manifest = self.load()
+            manifest['reports'][path] = report
+            # the report of any branch for '', as when no branch is asked for
+            latest = manifest['latest'].setdefault(format, {}).setdefault(repository, {}).setdefault(report['window'], {})
+            latest[branch] = path
+            latest[''] = path
+            writefile(self.path, json.dumps(manifest, sort_keys = True, indent = 1, separators = (',', ': ')) + '\n')
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def load(self):
+        try:
+            f = open(self.path, 'r')
+        except IOError:
+            return { 'reports': {}, 'latest': {} }
+        try:
+            return json.load(f)
+        except ValueError:
+            print('Warning: %s is not valid, starting a new one' % self.path)
+            return { 'reports': {}, 'latest': {} }
+        finally:
+            f.close()
@@ -7,4 +7,12 @@ class ReportCreator:
 
     def create(self, data, path):
         self.data = data
-        self.path = path
\ No newline at end of file
+        self.path = path
+
+    ##
+    # Get the directory of the report of a branch, path being the directory of
+    # the reports of the window
+    def getBranchPath(self, path, branch_name):
+        if branch_name != '':
+            path += '-' + branch_name.replace('/', '_')
+        return path
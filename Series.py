@@ -0,0 +1,134 @@
+__author__ = 'tho'
+
+import heapq
+import os
+import tempfile
+from array import array
+from itertools import groupby
+from operator import itemgetter
+
+from config import conf
+
+# Rows read back at once from each run of a spilled series
+CHUNK = 4096
+# Series sharing the memory budget at the same time
+SHARES = 4
+
+class Series(object):
+    """Rows of integers (stamp, value, ...) added in any order, and iterated in
+    stamp order, the row added last winning for a stamp. The rows are kept in
+    a typed array. With a memory budget, past as many rows as the budget
+    allows, they are sorted and spilled to a temporary file as a run, the runs
+    being merged back as the series is iterated."""
+    def __init__(self, columns, limit = None):
+        self.columns = columns + 1 # the stamp, and the values
+        self.limit = limit
+        if self.limit is None and conf['memory_budget'] > 0:
+            self.limit = conf['memory_budget'] * 1048576 / (SHARES * 8 * self.columns)
+        self.rows = array('l') # rows one after the other
+        self.runs = [] # (offset, rows) of the runs in the file
+        self.path = None
+        self.pid = None
+        self.ordered = True # whether the stamps were added in increasing order
+        self.length = 0 # rows, None until counted again
+        self.last = None
+
+    def __del__(self):
+        # forked processes share the file, the one which created it removes it.
+        # Objects of an older pickle may fail to unpickle before __init__
+        if getattr(self, 'path', None) is not None and self.pid == os.getpid():
+            os.remove(self.path)
+
+    ##
+    # Pickled as its rows, streamed from the runs as they are pickled and
+    # appended back one by one as they are unpickled, so that the rows are
+    # never all in memory. The rows are copied, cPickle not memoizing tuples
+    # which nothing else references.
+    def __reduce__(self):
+        return (Series, (self.columns - 1,), None, (tuple(list(row)) for row in self))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    ##
+    # Number of rows, that is of distinct stamps
+    def __len__(self):
+        if self.length is None:
+            self.length = sum([1 for row in self])
+        return self.length
+
+    def append(self, row):
+        stamp = row[0]
+        if self.ordered and self.last is not None and stamp <= self.last:
+            self.ordered = False
+        if not self.ordered:
+            # counted when needed
+            self.length = None
+        elif self.length is not None:
+            self.length += 1
+        self.last = stamp
+        self.rows.extend(row)
+        if self.limit is not None and len(self.rows) >= self.limit * self.columns:
+            self.spill()
+
+    def __iter__(self):
+        runs = [self.readRun(offset, rows) for (offset, rows) in self.runs] + [self.getRows(self.rows)]
+        if len(runs) == 1 and self.ordered:
+            # added in stamp order already
+            return runs[0]
+        return self.merge(runs)
+
+    ##
+    # Merge sorted runs, the runs being in the order they were added
+    def merge(self, runs):
+        keyed = [self.getKeys(i, run) for (i, run) in enumerate(self.sortRuns(runs))]
+        for (stamp, rows) in groupby(heapq.merge(*keyed), itemgetter(0)):
+            for row in rows:
+                pass
+            yield row[3]
+
+    def sortRuns(self, runs):
+        # the spilled runs are sorted, the rows in memory not yet
+        return runs[:-1] + [sorted(runs[-1], key = itemgetter(0))]
+
+    def getKeys(self, i, run):
+        return ((row[0], i, position, row) for (position, row) in enumerate(run))
+
+    def getRows(self, rows):
+        columns = self.columns
+        return (tuple(rows[i:i + columns]) for i in xrange(0, len(rows), columns))
+
+    ##
+    # Sort the rows in memory, the row added last staying last for a stamp,
+    # and append them to the file as a run
+    def spill(self):
+        rows = sorted(self.getRows(self.rows), key = itemgetter(0))
+        if self.path is None:
+            (fd, self.path) = tempfile.mkstemp(prefix = 'gitstats-', suffix = '.series')
+            os.close(fd)
+            self.pid = os.getpid()
+        f = open(self.path, 'ab')
+        f.seek(0, 2)
+        offset = f.tell()
+        run = array('l')
+        for row in rows:
+            run.extend(row)
+        run.tofile(f)
+        f.close()
+        self.runs.append((offset, len(rows)))
+        self.rows = array('l')
+
+    def readRun(self, offset, rows):
+        # a file of its own, so that runs and series are read independently
+        f = open(self.path, 'rb')
+        try:
+            f.seek(offset)
+            while rows > 0:
+                chunk = array('l')
+                chunk.fromfile(f, min(rows, CHUNK) * self.columns)
+                rows -= len(chunk) / self.columns
+                for row in self.getRows(chunk):
+                    yield row
+        finally:
+            f.close()
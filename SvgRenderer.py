@@ -0,0 +1,110 @@
+__author__ = 'tho'
+
+import datetime
+import math
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+from common import writefile
+
+# Colors of the series, as the gnuplot defaults
+COLORS = ('#9400d3', '#009e73', '#56b4e9', '#e69f00', '#f0e442', '#0072b2', '#e51e10', '#000000')
+
+class SvgRenderer:
+    """Draws the graphs of a report as standalone SVG files, in-process,
+    without any intermediate file."""
+    def __init__(self, path, width = 640, height = 240):
+        self.path = path
+        self.width = width
+        self.height = height
+
+    ##
+    # Draw one box per value, labels being the text under each box ('' for none)
+    def renderBoxes(self, name, values, labels, ylabel, rotate = False):
+        (left, top, right, bottom) = self.getPlotArea(rotate and 60 or 30)
+        ymax = self.getAxisMax(max(values + [0]))
+        elements = self.getYAxis(ylabel, ymax, left, top, right, bottom)
+        if len(values) > 0:
+            step = float(right - left) / len(values)
+            # skip labels rather than letting them overlap
+            every = int(math.ceil(len(values) * (rotate and 14.0 or 40.0) / (right - left)))
+            for (i, value) in enumerate(values):
+                x = left + (i + 0.25) * step
+                y = self.scale(value, ymax, bottom, top)
+                elements.append('<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" fill="%s"/>' % (x, y, step / 2, bottom - y, COLORS[0]))
+                if len(labels[i]) > 0 and i % every == 0:
+                    elements.append(self.getLabel(left + (i + 0.5) * step, bottom + 12, labels[i], rotate))
+        self.write(name, elements)
+
+    ##
+    # Draw lines of (title, values) series against stamps, with a legend when
+    # the series have titles. With steps, the values hold until the next stamp.
+    def renderLines(self, name, stamps, series, ylabel, steps = False):
+        (left, top, right, bottom) = self.getPlotArea(70)
+        ymax = self.getAxisMax(max([0] + [max(values + [0]) for (title, values) in series]))
+        elements = self.getYAxis(ylabel, ymax, left, top, right, bottom)
+        if len(stamps) > 0:
+            (first, last) = (min(stamps), max(stamps))
+            span = float(max(last - first, 1))
+            xs = [left + (stamp - first) / span * (right - left) for stamp in stamps]
+            for i in range(0, 6):
+                stamp = first + span * i / 5
+                x = left + (right - left) * i / 5.0
+                elements.append('<line x1="%.1f" y1="%d" x2="%.1f" y2="%d" stroke="#000"/>' % (x, bottom, x, bottom + 4))
+                elements.append(self.getLabel(x, bottom + 12, datetime.datetime.fromtimestamp(stamp).strftime('%Y-%m-%d'), True))
+            for (n, (title, values)) in enumerate(series):
+                points = []
+                for (i, (x, value)) in enumerate(zip(xs, values)):
+                    y = self.scale(value, ymax, bottom, top)
+                    if steps and i > 0:
+                        points.append('%.1f,%.1f' % (x, self.scale(values[i - 1], ymax, bottom, top)))
+                    points.append('%.1f,%.1f' % (x, y))
+                color = COLORS[n % len(COLORS)]
+                elements.append('<polyline fill="none" stroke="%s" points="%s"/>' % (color, ' '.join(points)))
+                if title is not None:
+                    y = top + 10 + 12 * n
+                    elements.append('<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="%s"/>' % (left + 8, y - 3, left + 28, y - 3, color))
+                    elements.append('<text x="%d" y="%d">%s</text>' % (left + 32, y, escape(title)))
+        self.write(name, elements)
+
+    def getPlotArea(self, margin):
+        return (60, 10, self.width - 10, self.height - margin)
+
+    ##
+    # Round the top of the y axis up to a multiple of 1, 2 or 5 times a power of ten
+    def getAxisMax(self, value):
+        if value <= 0:
+            return 1
+        magnitude = 10 ** int(math.floor(math.log10(value)))
+        for factor in (1, 2, 5, 10):
+            if value <= factor * magnitude:
+                return factor * magnitude
+        return 10 * magnitude
+
+    def scale(self, value, ymax, bottom, top):
+        return bottom - float(value) / ymax * (bottom - top)
+
+    def getYAxis(self, ylabel, ymax, left, top, right, bottom):
+        elements = []
+        for i in range(0, 6):
+            value = ymax * i / 5.0
+            y = self.scale(value, ymax, bottom, top)
+            elements.append('<line x1="%d" y1="%.1f" x2="%d" y2="%.1f" stroke="#ccc"/>' % (left, y, right, y))
+            elements.append('<text x="%d" y="%.1f" text-anchor="end">%s</text>' % (left - 4, y + 3, ('%.1f' % value).replace('.0', '')))
+        elements.append('<rect x="%d" y="%d" width="%d" height="%d" fill="none" stroke="#000"/>' % (left, top, right - left, bottom - top))
+        x = 12
+        y = (top + bottom) / 2
+        elements.append('<text x="%d" y="%d" text-anchor="middle" transform="rotate(-90 %d %d)">%s</text>' % (x, y, x, y, escape(ylabel)))
+        return elements
+
+    def getLabel(self, x, y, text, rotate):
+        if rotate:
+            return '<text x="%.1f" y="%d" text-anchor="end" transform="rotate(-45 %.1f %d)">%s</text>' % (x, y, x, y, escape(text))
+        return '<text x="%.1f" y="%d" text-anchor="middle">%s</text>' % (x, y, escape(text))
+
+    def write(self, name, elements):
+        svg = '<?xml version="1.0" encoding="UTF-8"?>\n'
+        svg += '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d" font-family=%s font-size="10">\n' % (self.width, self.height, self.width, self.height, quoteattr('sans-serif'))
+        svg += '\n'.join(elements)
+        svg += '\n</svg>\n'
+        writefile(os.path.join(self.path, name + '.svg'), svg)
@@ -0,0 +1,66 @@
+__author__ = 'tho'
+
+import heapq
+
+from config import conf
+
+class TopCounter:
+    """Counts of the keys counted the most, in bounded memory, with the
+    space-saving algorithm: up to capacity keys are counted exactly, then a
+    new key takes over the counter of the least counted key, its count being
+    kept as the error of the new key. A count is then at most its error above
+    the real count, and any key counted more than total / capacity is kept."""
+    def __init__(self, capacity = None):
+        if capacity is None:
+            capacity = conf['file_counters']
+        self.capacity = max(capacity, 1)
+        self.counters = {} # key -> [count, error]
+        self.total = 0
+        self.heap = None # (count, key) of the counters once they are all taken, stale ones included
+
+    def __getstate__(self):
+        return { 'capacity': self.capacity, 'counters': self.counters, 'total': self.total }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.heap = None
+
+    def add(self, key, weight = 1):
+        self.total += weight
+        counter = self.counters.get(key)
+        if counter is None:
+            if len(self.counters) < self.capacity:
+                counter = self.counters[key] = [0, 0]
+            else:
+                (count, least) = self.popLeast()
+                del self.counters[least]
+                counter = self.counters[key] = [count, count]
+        counter[0] += weight
+        if self.heap is not None:
+            heapq.heappush(self.heap, (counter[0], key))
+            if len(self.heap) > 4 * self.capacity:
+                self.heap = None
+
+    ##
+    # Remove the least counted key from the heap, returns (count, key)
+    def popLeast(self):
+        if self.heap is None:
+            self.heap = [(counter[0], key) for (key, counter) in self.counters.items()]
+            heapq.heapify(self.heap)
+        while True:
+            (count, key) = heapq.heappop(self.heap)
+            # skip the entries of keys counted again or taken over since
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                return (count, key)
+
+    ##
+    # Get the n keys counted the most as (key, count, error), the most first
+    def getTop(self, n):
+        top = heapq.nsmallest(n, self.counters.items(), key = lambda item: (-item[1][0], item[0]))
+        return [(key, counter[0], counter[1]) for (key, counter) in top]
+
+    ##
+    # Whether the counts are exact, every key having had a counter of its own
+    def isExact(self):
+        return len([counter for counter in self.counters.values() if counter[1] > 0]) == 0
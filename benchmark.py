@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# Copyright (c) 2007-2013 Heikki Hokkanen <hoxu@users.sf.net> & others (see doc/author.txt)
+# GPLv2 / GPLv3
+import getopt
+import json
+import random
+import shutil
+import subprocess
+import common
+from common import *
+from GitDataCollector import GitDataCollector, GitHistory
+from HtmlReportCreator import HTMLReportCreator
+from config import conf
+
+os.environ['LC_ALL'] = 'C'
+
+# Dates of the synthetic commits: from 2010-01-01, over ten years
+FIRST_STAMP = 1262304000
+SPAN = 10 * 365 * 86400
+TIMEZONES = ('+0000', '+0100', '+0200', '-0500', '-0800', '+0530', '+0900')
+EXTENSIONS = ('py', 'c', 'h', 'txt', 'md', 'js')
+
+def usage():
+    print("""
+Usage: benchmark [options] <workdir>
+
+Generate deterministic synthetic repositories in workdir, run the phases of
+gitstats on each, cold then again with the cache, and write the seconds of
+every phase as JSON.
+
+Options:
+-n commits       Commits of a repository, repeat for several (default: 10000)
+-a authors       Authors (default: 50)
+-f files         Files (default: 1000)
+-t tags          Tags (default: 20)
+-b branches      Branches (default: 3)
+-m every         Merge a side branch of 3 commits every that many commits, 0 for
+                 a linear history (default: 20)
+-s seed          Seed of the generator (default: 1)
+-o file          Results file (default: <workdir>/benchmark.json)
+-c key=value     Override configuration value
+""")
+
+class SyntheticRepository:
+    """Writes a repository with the given shape through git fast-import.
+    The same parameters always give the same commits, hashes included."""
+    def __init__(self, commits, authors, files, tags, branches, merge_every, seed):
+        self.commits = commits
+        self.authors = authors
+        self.files = files
+        self.tags = tags
+        self.branches = branches
+        self.merge_every = merge_every
+        self.seed = seed
+
+    def getName(self):
+        return 'repo-%d-%d-%d-%d-%d-%d-%d' % (self.commits, self.authors, self.files, self.tags, self.branches, self.merge_every, self.seed)
+
+    ##
+    # Create the repository at path, unless it was already created
+    def create(self, path):
+        if os.path.exists(os.path.join(path, 'done')):
+            return
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        subprocess.check_call(['git', 'init', '-q', '--bare', path])
+        p = subprocess.Popen(['git', '--git-dir', path, 'fast-import', '--quiet'], stdin = subprocess.PIPE, bufsize = -1)
+        self.write(p.stdin)
+        p.stdin.close()
+        if p.wait() != 0:
+            raise RuntimeError('git fast-import failed')
+        open(os.path.join(path, 'done'), 'w').close()
+
+    ##
+    # Write the fast-import stream: commits on master, side branches of 3
+    # commits merged back every merge_every commits, then the tags and the
+    # other branches, pointing at older commits
+    def write(self, f):
+        self.random = random.Random(self.seed)
+        self.contents = {} # file -> (first line, lines)
+        self.mark = 0
+        master = None
+        side = None # (newest commit, commits) of the side branch
+        touched = set() # files changed on the side branch
+        for i in range(0, self.commits):
+            stamp = FIRST_STAMP + SPAN * i / self.commits + self.random.randint(0, 600)
+            if side is not None and side[1] == 3:
+                # the merge takes the files of the side branch
+                master = self.writeCommit(f, stamp, [master, side[0]], sorted(touched))
+                side = None
+            elif side is not None:
+                paths = self.getChanges(i)
+                touched.update(paths)
+                side = (self.writeCommit(f, stamp, [side[0]], paths), side[1] + 1)
+            elif self.merge_every > 0 and i % self.merge_every == 0 and master is not None:
+                paths = self.getChanges(i)
+                touched = set(paths)
+                side = (self.writeCommit(f, stamp, [master], paths), 1)
+            else:
+                master = self.writeCommit(f, stamp, [master], self.getChanges(i))
+        # every commit was written to master, with its parents given
+        f.write('reset refs/heads/master\nfrom :%d\n\n' % master)
+        for i in range(0, self.tags):
+            f.write('reset refs/tags/v%d\nfrom :%d\n\n' % (i, max(1, self.mark * (i + 1) / (self.tags + 1))))
+        for i in range(1, self.branches):
+            f.write('reset refs/heads/branch%d\nfrom :%d\n\n' % (i, max(1, self.mark * i / self.branches)))
+
+    ##
+    # Pick the files changed by commit i, and change their content. The first
+    # commits add files, until there are self.files files.
+    def getChanges(self, i):
+        paths = set()
+        for n in range(0, self.random.randint(1, 3)):
+            k = self.random.randint(0, min(i, self.files - 1))
+            paths.add('dir%d/file%d.%s' % (k % 37, k, EXTENSIONS[k % len(EXTENSIONS)]))
+        for path in paths:
+            (first, lines) = self.contents.get(path, (0, 0))
+            lines += self.random.randint(0, 20)
+            if lines > 200 or self.random.random() < 0.2:
+                # remove lines from the top
+                removed = self.random.randint(0, lines)
+                (first, lines) = (first + removed, lines - removed)
+            self.contents[path] = (first, lines)
+        return sorted(paths)
+
+    def writeCommit(self, f, stamp, parents, paths):
+        self.mark += 1
+        # a few authors make most of the commits
+        author = int(self.authors * self.random.random() ** 2)
+        ident = 'Author %d <author%d@domain%d.example> %d %s' % (author, author, author % 7, stamp, TIMEZONES[author % len(TIMEZONES)])
+        message = 'Commit %d\n' % self.mark
+        f.write('commit refs/heads/master\nmark :%d\nauthor %s\ncommitter %s\ndata %d\n%s' % (self.mark, ident, ident, len(message), message))
+        if parents[0] is not None:
+            f.write('from :%d\n' % parents[0])
+        for parent in parents[1:]:
+            f.write('merge :%d\n' % parent)
+        for path in paths:
+            (first, lines) = self.contents[path]
+            data = ''.join(['line %d of %s\n' % (n, path) for n in range(first, first + lines)])
+            f.write('M 100644 inline %s\ndata %d\n%s\n' % (path, len(data), data))
+        f.write('\n')
+        return self.mark
+
+##
+# Run the phases of gitstats on the master branch of the repository at path,
+# reports going to output, returns the seconds of each phase
+def runphases(path, output):
+    common.phase_secs.clear()
+    start = time.time()
+    start_external = common.exectime_external
+    commands = len(common.external_commands)
+    pools = len(common.pool_usages)
+
+    os.chdir(path)
+    data = GitDataCollector()
+    data.loadCache(os.path.join(output, 'gitstats.cache'))
+    with phase('collect'):
+        data.collect(path, 'master', GitHistory())
+    with phase('cache'):
+        data.saveCache(os.path.join(output, 'gitstats.cache'))
+    with phase('refine'):
+        data.refine()
+    with phase('report'):
+        HTMLReportCreator().create(data, os.path.join(output, 'all'), 'master')
+    data.cache.close()
+
+    return {
+        'secs': time.time() - start,
+        'external_secs': common.exectime_external - start_external,
+        'external_commands': len(common.external_commands) - commands,
+        'phases': dict(common.phase_secs),
+        'pools': [usage._asdict() for usage in common.pool_usages[pools:]],
+        'peak_rss_kb': getpeakrss(),
+    }
+
+def main(args_orig):
+    optlist, args = getopt.getopt(args_orig, 'hn:a:f:t:b:m:s:o:c:', ['help'])
+    sizes = []
+    shape = { 'a': 50, 'f': 1000, 't': 20, 'b': 3, 'm': 20, 's': 1 }
+    results_file = None
+    for o, v in optlist:
+        if o == '-n':
+            sizes.append(int(v))
+        elif o[1:] in shape:
+            shape[o[1:]] = int(v)
+        elif o == '-o':
+            results_file = os.path.abspath(v)
+        elif o == '-c':
+            key, value = v.split('=', 1)
+            if key not in conf:
+                raise KeyError('no such key "%s" in config' % key)
+            if isinstance(conf[key], int):
+                conf[key] = int(value)
+            else:
+                conf[key] = value
+        elif o in ('-h', '--help'):
+            usage()
+            sys.exit()
+    if len(args) != 1:
+        usage()
+        sys.exit(0)
+    if len(sizes) == 0:
+        sizes = [10000]
+    workdir = os.path.abspath(args[0])
+    if results_file is None:
+        results_file = os.path.join(workdir, 'benchmark.json')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+
+    results = { 'version': getversion(), 'git': getgitversion(), 'python': sys.version.split()[0], 'conf': dict(conf), 'runs': [] }
+    for commits in sizes:
+        repository = SyntheticRepository(commits, shape['a'], shape['f'], shape['t'], shape['b'], shape['m'], shape['s'])
+        path = os.path.join(workdir, repository.getName())
+        print('Generating %s...' % path)
+        start = time.time()
+        repository.create(path)
+        generated = time.time() - start
+
+        output = os.path.join(workdir, 'output-%d' % commits)
+        if os.path.exists(output):
+            shutil.rmtree(output)
+        os.makedirs(output)
+        for run in ('cold', 'cached'):
+            print('Running %s, %d commits...' % (run, commits))
+            result = runphases(path, output)
+            result.update({ 'run': run, 'commits': commits, 'authors': shape['a'], 'files': shape['f'], 'tags': shape['t'],
+                'branches': shape['b'], 'merge_every': shape['m'], 'seed': shape['s'], 'generate_secs': generated })
+            results['runs'].append(result)
+
+    writefile(results_file, json.dumps(results, sort_keys = True, indent = 1) + '\n')
+
+    print('')
+    print('%10s %8s %10s %10s  %s' % ('commits', 'run', 'secs', 'external', 'phases'))
+    for result in results['runs']:
+        # the phases of each page and chart are left to the JSON
+        phases = ', '.join(['%s %.2f' % (name, secs) for (name, secs) in sorted(result['phases'].items()) if ' ' not in name])
+        print('%10d %8s %10.2f %10.2f  %s' % (result['commits'], result['run'], result['secs'], result['external_secs'], phases))
+    print('Results written to %s' % results_file)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,11 +1,18 @@
 __author__ = 'tho'
 
+import calendar
+import json
 import platform
 import os
+import resource
 import subprocess
 import sys
+import threading
 import time
-import re
+import shlex
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, timedelta
 
 from config import conf, gnuplot_cmd
 
@@ -13,6 +20,8 @@ GNUPLOT_COMMON = 'set terminal png transparent size 640,240\nset size 1.0,1.0\n'
 ON_LINUX = (platform.system() == 'Linux')
 WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
 VERSION = 0
+GIT_VERSION = None
+GNUPLOT_VERSION = None
 exectime_internal = 0.0
 exectime_external = 0.0
 
@@ -26,84 +35,332 @@ def html_header(level, text):
 def getkeyssortedbyvalues(dict):
     return map(lambda el : el[1], sorted(map(lambda el : (el[1], el[0]), dict.items())))
 
-def getpipeoutput(cmds, quiet = True):
+# Every external command run: argv list, seconds, bytes of output and exit status
+ExternalCommand = namedtuple('ExternalCommand', 'args secs bytes status')
+external_commands = []
+external_commands_lock = threading.Lock()
+
+# Spans of the run: phases, external commands and pools, in the process and
+# thread they ran in. The spans of a thread nest by time.
+Span = namedtuple('Span', 'name category start secs pid tid args')
+spans = []
+# Seconds spent in each phase of a run, by name of phase
+phase_secs = {}
+# Pools run: workers, seconds, and seconds the workers were busy
+PoolUsage = namedtuple('PoolUsage', 'name processes secs busy')
+pool_usages = []
+spans_lock = threading.Lock()
+
+# Print every external command run, with its seconds (-v)
+verbose = False
+
+def addexternalcommand(args, start, secs, nbytes, status):
     global exectime_external
+    external_commands_lock.acquire()
+    exectime_external += secs
+    external_commands.append(ExternalCommand(args, secs, nbytes, status))
+    external_commands_lock.release()
+    addspan(getcommandname(args), 'command', start, secs, { 'args': ' '.join(args), 'bytes': nbytes, 'status': status })
+
+def getcommandname(args):
+    """
+    Name of a command by its program and first word, "git log" for instance.
+    """
+    words = [os.path.basename(args[0])] + [arg for arg in args[1:] if not arg.startswith('-') and '/' not in arg][0:1]
+    return ' '.join(words)
+
+def addspan(name, category, start, secs, args = None):
+    spans_lock.acquire()
+    if category == 'phase':
+        phase_secs[name] = phase_secs.get(name, 0.0) + secs
+    spans.append(Span(name, category, start, secs, os.getpid(), threading.current_thread().ident, args))
+    spans_lock.release()
+
+def addspans(recorded):
+    """
+    Add the spans recorded by another process, such as a worker of a pool.
+    """
+    spans_lock.acquire()
+    spans.extend(recorded)
+    spans_lock.release()
+
+@contextmanager
+def phase(name, args = None):
+    """
+    Time the enclosed block as a phase of the run, recording it as a span and
+    adding its seconds to phase_secs[name].
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        addspan(name, 'phase', start, time.time() - start, args)
+
+def addpoolusage(name, start, processes, busy):
+    """
+    Record a pool run since start, its processes having been busy for busy
+    seconds in total.
+    """
+    secs = time.time() - start
+    utilisation = 0.0
+    if secs > 0:
+        utilisation = busy / (secs * processes)
+    pool_usages.append(PoolUsage(name, processes, secs, busy))
+    addspan(name, 'pool', start, secs, { 'processes': processes, 'busy': busy, 'utilisation': utilisation })
+
+def getpeakrss():
+    """
+    Peak resident memory in kilobytes, of this process or of the largest of
+    its child processes.
+    """
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def writetrace(filename):
+    """
+    Write the spans of the run in the trace event format of Chrome, as read by
+    chrome://tracing and Perfetto.
+    """
+    events = []
+    for span in spans:
+        events.append({ 'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': span.pid, 'tid': span.tid,
+            'ts': int(span.start * 1000000), 'dur': int(span.secs * 1000000), 'args': span.args or {} })
+    other = { 'peak_rss_kb': getpeakrss(), 'external_secs': exectime_external, 'external_commands': len(external_commands),
+        'pools': [usage._asdict() for usage in pool_usages] }
+    writefile(filename, json.dumps({ 'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': other }))
+
+def getpipestream(args, separator = '\n', quiet = True, input = None):
+    """
+    Run a single command given as an argv list and yield its output split on
+    separator as it arrives, without buffering the whole output in memory.
+    The lines in input are written to the standard input of the command.
+    """
     start = time.time()
+    quiet = quiet and not verbose
     if not quiet and ON_LINUX and os.isatty(1):
-        print('>> ' + ' | '.join(cmds))
+        print('>> ' + ' '.join(args))
         sys.stdout.flush()
-    p0 = subprocess.Popen(cmds[0], stdout = subprocess.PIPE, shell = True)
-    p = p0
-    for x in cmds[1:]:
-        p = subprocess.Popen(x, stdin = p0.stdout, stdout = subprocess.PIPE, shell = True)
-        p0 = p
-    output = p.communicate()[0]
-    end = time.time()
-    if not quiet:
-        if ON_LINUX and os.isatty(1):
-            print('\r')
-        print('[%.5f] >> %s' % (end - start, ' | '.join(cmds)))
-    exectime_external += (end - start)
-    return output.rstrip('\n')
+    try:
+        if input is None:
+            p = subprocess.Popen(args, stdout = subprocess.PIPE, bufsize = -1)
+        else:
+            p = subprocess.Popen(args, stdin = subprocess.PIPE, stdout = subprocess.PIPE, bufsize = -1)
+    except OSError as e:
+        print('Warning: failed to run "%s": %s' % (' '.join(args), e))
+        addexternalcommand(args, start, time.time() - start, 0, 127)
+        return
+    if input is not None:
+        # written from another thread, so that neither pipe fills up
+        def write():
+            p.stdin.write(''.join([line + '\n' for line in input]))
+            p.stdin.close()
+        threading.Thread(target = write).start()
+    pending = ''
+    nbytes = 0
+    try:
+        while True:
+            chunk = p.stdout.read(65536)
+            if not chunk:
+                break
+            nbytes += len(chunk)
+            records = (pending + chunk).split(separator)
+            pending = records.pop()
+            for record in records:
+                yield record
+        if pending:
+            yield pending
+    finally:
+        p.stdout.close()
+        status = p.wait()
+        end = time.time()
+        if not quiet:
+            if ON_LINUX and os.isatty(1):
+                print('\r')
+            print('[%.5f] >> %s' % (end - start, ' '.join(args)))
+        addexternalcommand(args, start, end - start, nbytes, status)
+
+def getpipeoutput(args, quiet = True, input = None):
+    """
+    Run a single command given as an argv list and return its output, without
+    the trailing newlines. Meant for commands with a short output, use
+    getpipestream() for the others.
+    """
+    return '\n'.join(getpipestream(args, '\n', quiet, input)).rstrip('\n')
+
+def writefile(filename, data, fingerprint = None):
+    """
+    Write data to filename through a temporary file renamed over it, so that
+    readers see either the old or the new contents. The file is left alone
+    when it already holds the same data, or, for an HTML page with volatile
+    parts, the same fingerprint of the other parts. Returns whether the file
+    was written.
+    """
+    if fingerprint is not None:
+        data += '<!-- fingerprint %s -->\n' % fingerprint
+    if os.path.isfile(filename):
+        f = open(filename, 'r')
+        if fingerprint is None:
+            same = os.path.getsize(filename) == len(data) and f.read() == data
+        else:
+            same = f.read().endswith('<!-- fingerprint %s -->\n' % fingerprint)
+        f.close()
+        if same:
+            return False
+    tempfile = '%s.%d.tmp' % (filename, os.getpid())
+    f = open(tempfile, 'w')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    os.rename(tempfile, filename)
+    return True
 
 def getversion():
     global VERSION
     if VERSION == 0:
         gitstats_repo = os.path.dirname(os.path.abspath(__file__))
-        VERSION = getpipeoutput(["git --git-dir=%s/.git --work-tree=%s rev-parse --short %s %s" %
-            (gitstats_repo, gitstats_repo, getcommitrange('HEAD').split('\n')[0], get_commit_time())])
+        VERSION = getpipeoutput(['git', '--git-dir=%s/.git' % gitstats_repo, '--work-tree=%s' % gitstats_repo,
+            'rev-parse', '--short', getcommitrange('HEAD').split('\n')[0]] + get_commit_time_args())
     return VERSION
 
 def getgitversion():
-    return getpipeoutput(['git --version']).split('\n')[0]
+    global GIT_VERSION
+    if GIT_VERSION is None:
+        GIT_VERSION = getpipeoutput(['git', '--version']).split('\n')[0]
+    return GIT_VERSION
 
 def getgnuplotversion():
-    return getpipeoutput(['%s --version' % gnuplot_cmd]).split('\n')[0]
+    global GNUPLOT_VERSION
+    if GNUPLOT_VERSION is None:
+        GNUPLOT_VERSION = getpipeoutput(shlex.split(gnuplot_cmd) + ['--version']).split('\n')[0]
+    return GNUPLOT_VERSION
 
 def getnumoffilesfromrev(time_rev):
     """
-    Get number of files changed in commit
+    Count the files in the tree of a revision, given as (time, rev), and
+    return (time, rev, count). Only needed for the commits a history walk
+    starts from; the file counts of the walked commits are derived from the
+    files each one adds and deletes.
     """
     time, rev = time_rev
-    return (int(time), rev, int(getpipeoutput(['git ls-tree -r --name-only "%s"' % rev, 'wc -l']).split('\n')[0]))
+    count = 0
+    for path in getpipestream(['git', 'ls-tree', '-r', '--name-only', '-z', rev], '\0'):
+        count += 1
+    return (int(time), rev, count)
 
-def getnumoflinesinblob(ext_blob):
+
+def getcommitrange(defaultrange = 'HEAD', end_only = False, end = None):
+    if end is None:
+        end = conf['commit_end']
+    if len(end) > 0:
+        if end_only or len(conf['commit_begin']) == 0:
+            return end
+        return '%s..%s' % (conf['commit_begin'], end)
+    return defaultrange
+
+def getbranches():
     """
-    Get number of lines in blob
+    Get the branches of the repository as a list of (name, rev), the remote
+    branch being used when there is a local and a remote branch of the same name
     """
-    ext, blob_id = ext_blob
-    return (ext, blob_id, int(getpipeoutput(['git cat-file blob %s' % blob_id, 'wc -l']).split()[0]))
+    branches = []
+    revs = {}
+    for line in getpipestream(['git', 'branch', '-a']):
+        if len(line) < 2:
+            continue
+        line = line[2:]
+        rev = line.split(' ')[0]
+        if rev.startswith('('):
+            # detached HEAD
+            continue
+        branch_name = rev.replace('remotes/origin/', '')
+        if branch_name == 'HEAD':
+            continue
+        if branch_name not in revs:
+            branches.append(branch_name)
+        if branch_name not in revs or rev.startswith('remotes/'):
+            revs[branch_name] = rev.replace('remotes/', '')
+    return [(branch_name, revs[branch_name]) for branch_name in branches]
 
+def isgitrepository(path):
+    if os.path.exists(os.path.join(path, '.git')):
+        return True
+    # bare repository
+    return os.path.isfile(os.path.join(path, 'HEAD')) and os.path.isdir(os.path.join(path, 'objects'))
 
-def getcommitrange(defaultrange = 'HEAD', end_only = False):
-    if len(conf['commit_end']) > 0:
-        if end_only or len(conf['commit_begin']) == 0:
-            return conf['commit_end']
-        return '%s..%s' % (conf['commit_begin'], conf['commit_end'])
-    return defaultrange
+def getrepositories(paths):
+    """
+    Get the git repositories given on the command line. A path that is not a
+    repository itself stands for the repositories directly inside it.
+    """
+    repositories = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if isgitrepository(path) or not os.path.isdir(path):
+            repositories.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            if isgitrepository(os.path.join(path, name)):
+                repositories.append(os.path.join(path, name))
+    return repositories
+
+def getrepositorysize(path):
+    """Get the size of the object store of the repository at path, in KiB"""
+    size = 0
+    for line in getpipestream(['git', '-C', path, 'count-objects', '-v']):
+        parts = line.split(': ')
+        if len(parts) == 2 and parts[0] in ('size', 'size-pack'):
+            size += int(parts[1])
+    return size
 
-def get_commit_time():
-    timerange = ""
+def get_commit_time_args():
+    """
+    Get the arguments limiting the history to time_begin and time_end
+    """
+    args = []
     if len(conf['time_end']) > 0:
-        timerange += ('--before="%s"' % conf['time_end'])
+        args.append('--before=%s' % conf['time_end'])
     if len(conf['time_begin']) > 0:
-        timerange += ('--since="%s"' % conf['time_begin'])
+        args.append('--since=%s' % conf['time_begin'])
+    return args
 
-    return timerange
+# Windows known by name: output suffix, and months or days before today they begin at
+WINDOWS = {
+    'all': ('', None, None),
+    'weekly': ('weekly', None, 7),
+    'monthly': ('monthly', 1, None),
+    'quarterly': ('quarterly', 3, None),
+}
 
+def getwindows(today = None):
+    """
+    Get the windows to generate reports for, as (output_suffix, time_begin),
+    from the comma separated conf['windows']: names of WINDOWS, or
+    <output suffix>:<time begin>. Without windows, the window of the
+    output_suffix and time_begin values. Raises ValueError for unknown names.
+    """
+    if len(conf['windows']) == 0:
+        return [(conf['output_suffix'], conf['time_begin'])]
+    if today is None:
+        today = date.today()
+    windows = []
+    for name in conf['windows'].split(','):
+        if ':' in name:
+            windows.append(tuple(name.split(':', 1)))
+            continue
+        if name not in WINDOWS:
+            raise ValueError('unknown window "%s", use %s or <output suffix>:<time begin>' % (name, ', '.join(sorted(WINDOWS.keys()))))
+        (suffix, months, days) = WINDOWS[name]
+        begin = ''
+        if months is not None:
+            # same day of the month, or the last day of shorter months
+            year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+            day = min(today.day, calendar.monthrange(year, month + 1)[1])
+            begin = date(year, month + 1, day).strftime('%Y-%m-%d')
+        elif days is not None:
+            begin = (today - timedelta(days = days)).strftime('%Y-%m-%d')
+        windows.append((suffix, begin))
+    return windows
 
 # dict['author'] = { 'commits': 512 } - ...key(dict, 'commits')
 def getkeyssortedbyvaluekey(d, key):
     return map(lambda el : el[1], sorted(map(lambda el : (d[el][key], el), d.keys())))
-
-def getstatsummarycounts(line):
-    numbers = re.findall('\d+', line)
-    if   len(numbers) == 1:
-        # neither insertions nor deletions: may probably only happen for "0 files changed"
-        numbers.append(0);
-        numbers.append(0);
-    elif len(numbers) == 2 and line.find('(+)') != -1:
-        numbers.append(0);    # only insertions were printed on line
-    elif len(numbers) == 2 and line.find('(-)') != -1:
-        numbers.insert(1, 0); # only deletions were printed on line
-    return numbers
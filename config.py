@@ -5,11 +5,18 @@ import os
 conf = {
     'max_domains': 10,
     'max_ext_length': 10,
+    'max_files': 10,
+    'file_counters': 10000,
     'style': 'gitstats.css',
+    'report': 'html',
+    'charts': 'gnuplot',
+    'max_points': 1000,
+    'downsampling': 'lttb',
     'max_authors': 20,
     'authors_top': 5,
     'commit_begin': '',
     'commit_end': 'HEAD',
+    'branches': 'all',
     'time_begin': '',
     'time_end': '',
     'linear_linestats': 1,
@@ -17,7 +24,11 @@ conf = {
     'merge_authors': {},
     'output': '/opt/web/gitstats/',
     'output_suffix': '',
+    'windows': '',
     'processes': 8,
+    'repo_processes': 1,
+    'prepare': 0,
+    'memory_budget': 0,
 }
 
 # By default, gnuplot is searched from path, but can be overridden with the
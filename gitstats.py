@@ -3,11 +3,18 @@
 # GPLv2 / GPLv3
 from datetime import datetime
 import getopt
+import multiprocessing
+import traceback
+import common
 from common import *
-from GitDataCollector import GitDataCollector
+from Cache import Cache
+from GitDataCollector import GitDataCollector, GitHistory
+from GitPreparer import GitPreparer
 
 from HtmlReportCreator import HTMLReportCreator
-from common import getgnuplotversion, exectime_external
+from JsonReportCreator import JSONReportCreator
+from Manifest import Manifest
+from common import getgnuplotversion
 from config import conf
 
 if sys.version_info < (2, 6):
@@ -22,8 +29,13 @@ def usage():
     print("""
 Usage: gitstats [options] <gitpath..> <outputpath>
 
+A gitpath that is not a git repository stands for the repositories in it.
+
 Options:
 -c key=value     Override configuration value
+-v               Print the external commands run, and where the time went
+--trace file     Write the phases and commands of the run to file, as Chrome
+                 trace events (chrome://tracing, https://ui.perfetto.dev)
 
 Default config values:
 %s
@@ -34,7 +46,8 @@ Please see the manual page for more details.
 
 class GitStats:
     def run(self, args_orig):
-        optlist, args = getopt.getopt(args_orig, 'hc:', ["help"])
+        optlist, args = getopt.getopt(args_orig, 'hvc:', ["help", "trace="])
+        trace_file = None
         for o, v in optlist:
             if o == '-c':
                 key, value = v.split('=', 1)
@@ -47,10 +60,13 @@ class GitStats:
                     conf[key][kk] = vv
                 else:
                     conf[key] = value
+            elif o == '-v':
+                common.verbose = True
+            elif o == '--trace':
+                trace_file = os.path.abspath(v)
             elif o in ('-h', '--help'):
                 usage()
                 sys.exit()
-
         if len(args) < 1:
             usage()
             sys.exit(0)
@@ -71,99 +87,237 @@ class GitStats:
             print('FATAL: Output path is not a directory or does not exist')
             sys.exit(1)
 
-        if not getgnuplotversion():
-            print('gnuplot not found')
+        if conf['charts'] not in ('gnuplot', 'svg'):
+            print('FATAL: charts must be "gnuplot" or "svg"')
+            sys.exit(1)
+        if conf['downsampling'] not in ('lttb', 'buckets'):
+            print('FATAL: downsampling must be "lttb" or "buckets"')
+            sys.exit(1)
+        if conf['memory_budget'] < 0:
+            print('FATAL: memory_budget must be 0 or more megabytes')
+            sys.exit(1)
+        try:
+            getwindows()
+        except ValueError as e:
+            print('FATAL: %s' % e)
+            sys.exit(1)
+        if conf['branches'] not in ('all', 'head'):
+            print('FATAL: branches must be "all" or "head"')
+            sys.exit(1)
+        if conf['report'] not in ('html', 'json'):
+            print('FATAL: report must be "html" or "json"')
+            sys.exit(1)
+        if conf['report'] == 'html' and conf['charts'] == 'gnuplot' and not getgnuplotversion():
+            print('gnuplot not found, use -c charts=svg to draw the graphs without it')
             sys.exit(1)
 
         print('Output path: %s' % output_path)
-        cached_file = os.path.join(output_path, 'gitstats.cache')
+        print('Running dir: %s' % rundir)
 
         if len(args) == 1:
             input_paths = args[0:]
         else:
             input_paths = args[0:-1]
 
-        input_path = input_paths[0]
-        # only for 1 path
-        # for gitpath in gitpaths:
+        repositories = getrepositories(input_paths)
+        if len(repositories) == 0:
+            print('FATAL: No git repositories found')
+            sys.exit(1)
+
+        if len(repositories) == 1:
+            with phase('repository', { 'path': repositories[0] }):
+                self.runRepository(repositories[0], output_path)
+        else:
+            results = self.runRepositories(repositories, output_path)
+            common.exectime_external += sum([result[2] for result in results])
+            print('')
+            print('%10s %10s  %s' % ('secs', 'external', 'repository'))
+            for (path, exectime, exectime_repo_external, error, repo_spans) in results:
+                print('%10.2f %10.2f  %s%s' % (exectime, exectime_repo_external, path, error and ' (FAILED)' or ''))
+            failed = [path for (path, exectime, exectime_repo_external, error, repo_spans) in results if error]
+            if len(failed) > 0:
+                print('Warning: %d of %d repositories failed' % (len(failed), len(results)))
 
+        time_end = time.time()
+        exectime_internal = time_end - time_start
+        print('Execution time %.5f secs, %.5f secs (%.2f %%) in external commands)' % (
+        exectime_internal, common.exectime_external, (100.0 * common.exectime_external) / exectime_internal))
+        if common.verbose:
+            self.printProfile()
+        if trace_file is not None:
+            writetrace(trace_file)
+            print('Trace written to %s' % trace_file)
+        if sys.stdin.isatty():
+            print('Finished!')
+
+    ##
+    # Print the seconds of every phase, the use of the pools, the external
+    # commands by command, and the peak memory
+    def printProfile(self):
+        phases = {}
+        commands = {}
+        for span in common.spans:
+            if span.category == 'phase':
+                phases[span.name] = phases.get(span.name, 0.0) + span.secs
+            elif span.category == 'command':
+                (n, secs, nbytes) = commands.get(span.name, (0, 0.0, 0))
+                commands[span.name] = (n + 1, secs + span.secs, nbytes + span.args['bytes'])
+        print('')
+        print('%10s  %s' % ('secs', 'phase'))
+        for (name, secs) in sorted(phases.items(), key = lambda item: -item[1]):
+            print('%10.2f  %s' % (secs, name))
+        print('')
+        print('%10s %10s %8s  %s' % ('secs', 'busy', 'workers', 'pool'))
+        for usage in common.pool_usages:
+            print('%10.2f %9.0f%% %8d  %s' % (usage.secs, 100.0 * usage.busy / max(usage.secs * usage.processes, 1e-6), usage.processes, usage.name))
+        print('')
+        print('%10s %8s %12s  %s' % ('secs', 'runs', 'bytes', 'command'))
+        for (name, (n, secs, nbytes)) in sorted(commands.items(), key = lambda item: -item[1][1]):
+            print('%10.2f %8d %12d  %s' % (secs, n, nbytes, name))
+        print('')
+        print('Peak memory: %d MB' % (getpeakrss() / 1024))
+
+    ##
+    # Generate the reports of many repositories on a pool of conf['repo_processes']
+    # processes, the largest repositories first so that they do not end up last.
+    # Returns a list of (path, secs, secs in external commands, error, spans)
+    def runRepositories(self, repositories, output_path):
+        sizes = dict([(path, getrepositorysize(path)) for path in repositories])
+        repositories = sorted(repositories, key = lambda path: sizes[path], reverse = True)
+        processes = max(1, min(conf['repo_processes'], len(repositories)))
+        print('Generating reports of %d repositories, %d at a time' % (len(repositories), processes))
+
+        # create or convert the cache once, before the workers open it
+        Cache(os.path.join(output_path, 'gitstats.cache')).close()
+
+        jobs = [(path, output_path) for path in repositories]
+        start = time.time()
+        if processes == 1:
+            results = map(runrepository, jobs)
+        else:
+            pool = multiprocessing.Pool(processes)
+            results = list(pool.imap_unordered(runrepository, jobs))
+            pool.close()
+            pool.join()
+            for result in results:
+                addspans(result[4])
+        addpoolusage('repositories', start, processes, sum([result[1] for result in results]))
+        return results
+
+    ##
+    # Generate the reports of all branches of the repository at input_path, for
+    # every window. Branches and windows are collected by rev, sharing the
+    # commits they have in common, which are read and diffed only once.
+    def runRepository(self, input_path, output_path):
         print('Git path: %s' % input_path)
-        print('Running dir: %s' % rundir)
+        # git is run in the current directory
+        os.chdir(input_path)
+
+        if conf['prepare']:
+            with phase('prepare'):
+                GitPreparer().prepare()
+
+        # Only the given branch when commit_end is set, or the branch checked
+        # out in this repository with branches=head.
+        branches = getbranches()
+        if conf['commit_end'] != 'HEAD' or conf['branches'] == 'head':
+            end = conf['commit_end']
+            if end == 'HEAD':
+                end = getpipeoutput(['git', 'symbolic-ref', '--short', '-q', 'HEAD']) or 'HEAD'
+            branch_name = end.replace('origin/', '')
+            branches = [(name, rev) for (name, rev) in branches if name == branch_name]
+            if len(branches) == 0:
+                branches = [(branch_name, end)]
+        history = GitHistory()
+        window = (conf['output_suffix'], conf['time_begin'])
+        try:
+            for (output_suffix, time_begin) in getwindows():
+                conf['output_suffix'] = output_suffix
+                conf['time_begin'] = time_begin
+                for (branch_name, rev) in branches:
+                    self.runBranch(input_path, output_path, history, branch_name, rev)
+        finally:
+            (conf['output_suffix'], conf['time_begin']) = window
+
+    ##
+    # Generate the report of one branch, for the window set by output_suffix
+    # and time_begin
+    def runBranch(self, input_path, output_path, history, branch_name, rev):
+        cached_file = os.path.join(output_path, 'gitstats.cache')
         project_dir = os.path.basename(os.path.abspath(input_path))
+        data = GitDataCollector()
+
+        os.chdir(input_path)
 
-        # loop through all branches, generate report for each branch
-        main_branch = 'master'
-        lines = getpipeoutput(['git branch -a']).split('\n')
-        for line in lines:
-            data = GitDataCollector()
-
-            # get local branch name
-            if len(line) < 2:
-                continue
-            line = line[2:]
-            branch_name = line.split(' ')[0].replace('remotes/origin/', '')
-            if branch_name == 'HEAD':
-                main_branch = line.split(' ')[2]
-                continue
-
-            os.chdir(rundir)
-
-            # delete the branch
-            getpipeoutput(['git branch -D %s' % branch_name])
-            # create the branch
-            getpipeoutput(['git checkout -b %s --track origin/%s' % (branch_name, branch_name)])
-
-            print('Collecting data...')
-            data.collect(input_path)
-            os.chdir(rundir)
-
-            print('Refining data...')
+        print('Collecting data of %s...' % rev)
+        data.loadCache(cached_file)
+        with phase('collect', { 'branch': branch_name, 'window': conf['output_suffix'] }):
+            data.collect(input_path, rev, history)
+        os.chdir(input_path)
+
+        print('Refining data...')
+        with phase('cache'):
             data.saveCache(cached_file)
+        with phase('refine'):
             data.refine()
 
-            os.chdir(rundir)
-
-            print('project dir: %s' % project_dir)
-            print('Generating report...')
-            print('Output dir: %s' % output_path)
-
-            output_suffix = conf['output_suffix']
-            single_project_output_path = os.path.join(output_path, data.projectname, output_suffix)
-
-            time_begin = conf['time_begin']
-            time_end = conf['time_end']
-            if not time_end:
-                time_end = datetime.now().strftime("%Y-%m-%d")
-            if time_begin:
-                # time_format = '%Y-%m-%d %H:%M:%S'
-                single_project_output_path = os.path.join(single_project_output_path, "%s to %s" % (time_begin, time_end))
-            else:
-                single_project_output_path = os.path.join(single_project_output_path, "all")
-
-            try:
-                os.makedirs(single_project_output_path)
-            except OSError:
-                pass
-            if not os.path.isdir(single_project_output_path):
-                print('FATAL: Unable to create output folder')
-                sys.exit(1)
+        os.chdir(input_path)
 
-            report = HTMLReportCreator()
-            report.create(data, single_project_output_path, branch_name)
-            getpipeoutput(['git reset HEAD --hard'])
+        print('project dir: %s' % project_dir)
+        print('Generating report...')
+        print('Output dir: %s' % output_path)
 
-        print("Switch back to main branch: %s" % main_branch)
-        getpipeoutput(['git checkout %s' % main_branch])
+        output_suffix = conf['output_suffix']
+        single_project_output_path = os.path.join(output_path, data.projectname, output_suffix)
 
-        time_end = time.time()
-        exectime_internal = time_end - time_start
-        print('Execution time %.5f secs, %.5f secs (%.2f %%) in external commands)' % (
-        exectime_internal, exectime_external, (100.0 * exectime_external) / exectime_internal))
-        if sys.stdin.isatty():
-            print('Finished!')
+        time_begin = conf['time_begin']
+        time_end = conf['time_end']
+        if not time_end:
+            time_end = datetime.now().strftime("%Y-%m-%d")
+        if time_begin:
+            # time_format = '%Y-%m-%d %H:%M:%S'
+            single_project_output_path = os.path.join(single_project_output_path, "%s to %s" % (time_begin, time_end))
+        else:
+            single_project_output_path = os.path.join(single_project_output_path, "all")
+
+        try:
+            os.makedirs(single_project_output_path)
+        except OSError:
+            pass
+        if not os.path.isdir(single_project_output_path):
+            print('FATAL: Unable to create output folder')
+            sys.exit(1)
+
+        if conf['report'] == 'json':
+            report = JSONReportCreator()
+        else:
+            report = HTMLReportCreator()
+        with phase('report', { 'branch': branch_name, 'window': conf['output_suffix'] }):
+            report.create(data, single_project_output_path, branch_name)
+        Manifest(output_path).addReport(data.projectname, branch_name, output_suffix, time_begin, time_end,
+            report.getBranchPath(single_project_output_path, branch_name), conf['report'])
+
+def runrepository(job):
+    """
+    Generate the reports of one repository, as a job of the pool. Failures are
+    returned instead of raised, so that the other repositories carry on. The
+    spans recorded are returned for the trace of the run.
+    """
+    (path, output_path) = job
+    first = len(common.spans)
+    start = time.time()
+    start_external = common.exectime_external
+    error = None
+    try:
+        with phase('repository', { 'path': path }):
+            GitStats().runRepository(path, output_path)
+    except (Exception, SystemExit):
+        error = traceback.format_exc()
+        print('Warning: failed to generate the reports of %s:\n%s' % (path, error))
+    sys.stdout.flush()
+    return (path, time.time() - start, common.exectime_external - start_external, error, common.spans[first:])
 
 
 if __name__ == '__main__':
     g = GitStats()
     g.run(sys.argv[1:])
-
@@ -1,26 +1,34 @@
 <?php
-// Grab all files from the desired folder
+// Redirect to the latest report of a repository, window (mode) and branch,
+// as listed in the manifest written by gitstats
 define(SEPARATOR, '-');
 
 $repo = basename($_GET['folder']);
 $mode = basename($_GET['mode']);
 
-$branch = isset($_GET['branch']) ? SEPARATOR . basename($_GET['branch']) : '';
+$branch = isset($_GET['branch']) ? basename($_GET['branch']) : '';
 
-$files = glob("$repo/$mode$branch/*");
+$manifest = json_decode(@file_get_contents('manifest.json'), true);
+if (isset($manifest['latest']['html'][$repo][$mode][$branch])) {
+	$goto = $manifest['latest']['html'][$repo][$mode][$branch];
+} else {
+	// reports generated before the manifest
+	$branch = $branch != '' ? SEPARATOR . $branch : '';
+	$files = glob("$repo/$mode$branch/*");
 
-$dirs = array_filter($files, 'is_dir');
-array_multisort(
-	array_map( 'filemtime', $dirs ),
-	SORT_NUMERIC,
-	SORT_DESC,
-	$dirs
-);
+	$dirs = array_filter($files, 'is_dir');
+	array_multisort(
+		array_map( 'filemtime', $dirs ),
+		SORT_NUMERIC,
+		SORT_DESC,
+		$dirs
+	);
 
-$goto = $dirs[0];
+	$goto = $dirs[0];
+}
 
 if (!$goto) {
 	die("Not found!");
 } else {
 	header("Location: $goto");
-}
\ No newline at end of file
+}
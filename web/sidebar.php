@@ -18,13 +18,20 @@
 	<ul id="browser" class="filetree">
 
 		<?php
-			$dirs = array_filter(glob('*'), 'is_dir');
+			$manifest = json_decode(@file_get_contents('manifest.json'), true);
+			if (isset($manifest['latest']['html'])) {
+				$dirs = array_keys($manifest['latest']['html']);
+				sort($dirs);
+			} else {
+				// reports generated before the manifest
+				$dirs = array_filter(glob('*'), 'is_dir');
+			}
 			foreach ($dirs as $dir) {
 				if ($dir == "assets") continue;
 		?>
 		<li class="closed"><span class="folder"><?=$dir ?></span>
 			<ul>
-				<li><a href="<?=$dir ?>/all" target="_main" class="file">All-time</a></li>
+				<li><a href="latest.php?folder=<?=$dir ?>&mode=all" target="_main" class="file">All-time</a></li>
 				<li><a href="latest.php?folder=<?=$dir ?>&mode=weekly" target="_main" class="file">Weekly</a></li>
 				<li><a href="latest.php?folder=<?=$dir ?>&mode=monthly" target="_main" class="file">Monthly</a></li>
 				<li><a href="latest.php?folder=<?=$dir ?>&mode=quarterly" target="_main" class="file">Quarterly</a></li>